@@ -9,6 +9,43 @@ class Config:
     
     # API Keys
     ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
+    TWELVE_DATA_API_KEY = os.getenv("TWELVE_DATA_KEY")
+    
+    # Twelve Data limits (free plan: 8 credits per minute)
+    TWELVE_DATA_RATE_LIMIT = int(os.getenv("TWELVE_DATA_RATE_LIMIT", "8"))
+    TWELVE_DATA_MAX_WORKERS = int(os.getenv("TWELVE_DATA_MAX_WORKERS", "4"))
+    
+    # Beta cache entries older than this are recomputed
+    BETA_CACHE_TTL_HOURS = float(os.getenv("BETA_CACHE_TTL_HOURS", "24"))
+    
+    # Imports: rows written and committed per chunk
+    IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+    # CSV rows read per streamed chunk, and how many error messages an import keeps
+    IMPORT_CSV_CHUNK_ROWS = int(os.getenv("IMPORT_CSV_CHUNK_ROWS", "20000"))
+    IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+    # Processes parsing PDF statement pages (0 = one per CPU), each given at least IMPORT_PDF_PAGES_PER_WORKER
+    # pages; shorter statements are parsed in-process
+    IMPORT_PDF_WORKERS = int(os.getenv("IMPORT_PDF_WORKERS", "0"))
+    IMPORT_PDF_PAGES_PER_WORKER = int(os.getenv("IMPORT_PDF_PAGES_PER_WORKER", "10"))
+    # Days before the Trading212 sync watermark that are read again, for orders that complete late
+    T212_SYNC_LOOKBACK_DAYS = int(os.getenv("T212_SYNC_LOOKBACK_DAYS", "7"))
+    
+    # Broker and market data HTTP: timeouts in seconds, retries on 429/5xx, connections per host
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+    HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+    HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "4"))
+    # Share of a broker's rate-limit window that background syncs leave for interactive calls
+    RATE_LIMIT_INTERACTIVE_RESERVE = float(os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", "0.2"))
+    BINANCE_WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", "6000"))
+    
+    # Price Store
+    PRICE_REFRESH_HOURS = float(os.getenv("PRICE_REFRESH_HOURS", "12"))
+    PRICE_LOOKBACK_DAYS = int(os.getenv("PRICE_LOOKBACK_DAYS", "365"))
+    # outputsize=full is premium on most Alpha Vantage keys; compact covers the last 100 trading days
+    PRICE_FULL_HISTORY = os.getenv("PRICE_FULL_HISTORY", "False").lower() == "true"
     
     # App Settings
     APP_NAME = "Portfolio Tracker"
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, select, update, bindparam, text
 from sqlalchemy.orm import sessionmaker
 import os
 import sys
@@ -7,7 +7,7 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from config import Config
-from database.models import Base
+from database.models import Base, transaction_fingerprint
 
 engine = create_engine(Config.DATABASE_URL, echo=Config.DEBUG)
 
@@ -16,6 +16,59 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 def init_db():
     """Create all tables in the database"""
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+
+def migrate_db():
+    """Bring databases created by older versions up to the current schema"""
+    transactions = Base.metadata.tables["transactions"]
+    columns = [column["name"] for column in inspect(engine).get_columns("transactions")]
+    
+    with engine.begin() as conn:
+        # external_id arrived with side- and occurrence-aware fingerprints, so without it every key is re-derived
+        rekey = "external_id" not in columns
+        if not rekey and "fingerprint" in columns and conn.execute(
+            select(transactions.c.id).where(transactions.c.fingerprint.is_(None)).limit(1)
+        ).first() is None:
+            # Already current; init_db runs on every Streamlit rerun, so stop here
+            return
+        
+        if "fingerprint" not in columns:
+            conn.execute(text("ALTER TABLE transactions ADD COLUMN fingerprint VARCHAR(40)"))
+        if rekey:
+            conn.execute(text("ALTER TABLE transactions ADD COLUMN external_id VARCHAR(64)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_external_id ON transactions (external_id)"))
+        
+        # Rows keep their order by id; an identical earlier row pushes a trade to the next occurrence number
+        query = select(
+            transactions.c.id, transactions.c.portfolio_id, transactions.c.symbol, transactions.c.transaction_type,
+            transactions.c.quantity, transactions.c.price, transactions.c.date
+        ).order_by(transactions.c.id)
+        if rekey:
+            seen = set()
+        else:
+            seen = set(conn.execute(
+                select(transactions.c.fingerprint).where(transactions.c.fingerprint.isnot(None))
+            ).scalars())
+            query = query.where(transactions.c.fingerprint.is_(None))
+        rows = conn.execute(query).all()
+        
+        updates = []
+        for tx_id, portfolio_id, symbol, tx_type, quantity, price, tx_date in rows:
+            occurrence = 0
+            fingerprint = transaction_fingerprint(portfolio_id, symbol, tx_type, quantity, price, tx_date)
+            while fingerprint in seen:
+                occurrence += 1
+                fingerprint = transaction_fingerprint(portfolio_id, symbol, tx_type, quantity, price, tx_date, occurrence)
+            seen.add(fingerprint)
+            updates.append({"tx_id": tx_id, "fp": fingerprint})
+        
+        if updates:
+            conn.execute(
+                update(transactions).where(transactions.c.id == bindparam("tx_id")).values(fingerprint=bindparam("fp")),
+                updates
+            )
+        
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_transactions_fingerprint ON transactions (fingerprint)"))
 
 def get_db():
     """Get database session"""
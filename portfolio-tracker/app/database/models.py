@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, ForeignKey, Enum, Boolean, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
+import hashlib
 
 Base = declarative_base()
 
@@ -49,6 +50,7 @@ class Portfolio(Base):
     user = relationship("User", back_populates="portfolios")
     transactions = relationship("Transaction", back_populates="portfolio")
     realized_pnls = relationship("RealizedPnL", back_populates="portfolio")
+    holdings = relationship("Holding", back_populates="portfolio")
 
 class Asset(Base):
     __tablename__ = "assets"
@@ -72,8 +74,45 @@ class Transaction(Base):
     fee = Column(Float, default=0)
     date = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    fingerprint = Column(String(40), unique=True, index=True)  # Hash of the natural key, see transaction_fingerprint
+    external_id = Column(String(64), index=True)  # Broker trade/order id, e.g. trading212:123456
     
     portfolio = relationship("Portfolio", back_populates="transactions")
+
+def transaction_key(portfolio_id: int, symbol: str, transaction_type, quantity: float, price: float, date: datetime):
+    """Natural key of a trade: portfolio, symbol, side, quantity, price and timestamp"""
+    side = transaction_type.value if isinstance(transaction_type, TransactionType) else str(transaction_type).lower()
+    return f"{portfolio_id}|{str(symbol).strip().upper()}|{side}|{float(quantity):.8f}|{float(price):.8f}|{date.isoformat()}"
+
+def transaction_fingerprint(portfolio_id: int, symbol: str, transaction_type, quantity: float, price: float,
+                            date: datetime, occurrence: int = 0, external_id: str = None):
+    """Deterministic dedup key: the broker's trade/order id if known, else the natural key and its occurrence"""
+    # occurrence numbers identical trades within one file (0 for the first), so genuine repeats are
+    # kept while uploading the same file again still matches every row
+    if external_id:
+        key = f"{portfolio_id}|id|{external_id}"
+    else:
+        key = f"{transaction_key(portfolio_id, symbol, transaction_type, quantity, price, date)}|{occurrence}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class Holding(Base):
+    __tablename__ = "holdings"
+    __table_args__ = (UniqueConstraint("portfolio_id", "symbol", name="uq_holdings_portfolio_symbol"),)
+    
+    id = Column(Integer, primary_key=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"), nullable=False, index=True)
+    symbol = Column(String(10), nullable=False)
+    quantity = Column(Float, default=0)
+    total_cost = Column(Float, default=0)  # Sum of buy quantity x price, as in calculate_holdings
+    fees = Column(Float, default=0)
+    realized_pnl = Column(Float, default=0)  # FIFO
+    open_lots = Column(Text, default="[]")  # JSON list of [quantity, price, date] FIFO lots, oldest first
+    last_tx_date = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    portfolio = relationship("Portfolio", back_populates="holdings")
+
 class RealizedPnL(Base):
     __tablename__ = "realized_pnl"
     
@@ -85,4 +124,80 @@ class RealizedPnL(Base):
     order_date = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    portfolio = relationship("Portfolio", back_populates="realized_pnls")
\ No newline at end of file
+    portfolio = relationship("Portfolio", back_populates="realized_pnls")
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    __table_args__ = (UniqueConstraint("portfolio_id", "source", "content_hash", name="uq_import_jobs_file"),)
+    
+    id = Column(Integer, primary_key=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"), nullable=False, index=True)
+    source = Column(String(30), nullable=False)  # trading212_csv, generic_csv, trading212_pdf
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of the uploaded file
+    status = Column(String(20), default="running")  # running, completed
+    rows_committed = Column(Integer, default=0)  # Input rows fully written; a resumed import starts after them
+    imported = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BrokerSyncState(Base):
+    __tablename__ = "broker_sync_state"
+    __table_args__ = (UniqueConstraint("portfolio_id", "broker", name="uq_broker_sync_state"),)
+    
+    id = Column(Integer, primary_key=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"), nullable=False, index=True)
+    broker = Column(String(30), nullable=False)  # trading212_history, binance
+    last_order_id = Column(String(50))  # Newest order seen by the last complete sync
+    last_order_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PriceHistory(Base):
+    __tablename__ = "price_history"
+    __table_args__ = (UniqueConstraint("symbol", "date", name="uq_price_history_symbol_date"),)
+    
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String(10), nullable=False, index=True)
+    date = Column(Date, nullable=False)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float, nullable=False)
+    volume = Column(Float)
+
+class PriceSymbol(Base):
+    __tablename__ = "price_symbols"
+    
+    symbol = Column(String(10), primary_key=True)
+    first_date = Column(Date)
+    last_date = Column(Date)
+    last_fetched_at = Column(DateTime)  # Last time Alpha Vantage was asked for this symbol
+
+
+class BetaCache(Base):
+    __tablename__ = "beta_cache"
+    __table_args__ = (UniqueConstraint("ticker", "benchmark", "window", "as_of", name="uq_beta_cache_key"),)
+    
+    id = Column(Integer, primary_key=True)
+    ticker = Column(String(20), nullable=False, index=True)
+    benchmark = Column(String(20), nullable=False)
+    window = Column(Integer, nullable=False)  # Number of daily bars the beta was estimated on
+    as_of = Column(Date, nullable=False)  # Last benchmark date in the window
+    beta = Column(Float)
+    alpha = Column(Float)
+    r_squared = Column(Float)
+    residual_vol = Column(Float)
+    observations = Column(Integer)
+    computed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class BenchmarkReturns(Base):
+    __tablename__ = "benchmark_returns"
+    __table_args__ = (UniqueConstraint("benchmark", "window", "as_of", name="uq_benchmark_returns_key"),)
+    
+    id = Column(Integer, primary_key=True)
+    benchmark = Column(String(20), nullable=False)
+    window = Column(Integer, nullable=False)  # Number of daily bars requested
+    as_of = Column(Date, nullable=False)  # Last date in the series
+    returns = Column(Text, nullable=False)  # JSON [[date, return], ...] oldest first
+    computed_at = Column(DateTime, default=datetime.utcnow, index=True)
\ No newline at end of file
@@ -2,7 +2,6 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-import numpy as np
 import sys
 import os
 import json
@@ -278,7 +277,7 @@ def show_dashboard():
     
     if portfolio:
         service = PortfolioService(db)
-        holdings = service.calculate_holdings(portfolio.id)
+        holdings = service.get_holdings(portfolio.id)
         
         price_service = PriceService()
         current_prices = {}
@@ -289,7 +288,7 @@ def show_dashboard():
                 if "error" not in result:
                     current_prices[sym] = result["price"]
         
-        summary = service.get_portfolio_summary(portfolio.id, current_prices)
+        summary = service.get_portfolio_summary(portfolio.id, current_prices, holdings=holdings)
         active_symbols = [sym for sym, data in holdings.items() if data["quantity"] > 0]
         
         # Tab 1: Dashboard
@@ -574,7 +573,7 @@ def show_dashboard():
                 
                 if st.button("Optimize Portfolio", key="optimize_btn"):
                     with st.spinner("Optimizing..."):
-                        opt_service = OptimizationService()
+                        opt_service = OptimizationService(db)
                         
                         if optimization_type == "Max Sharpe Ratio":
                             result, error = opt_service.optimize_max_sharpe(active_symbols)
@@ -634,9 +633,18 @@ def show_dashboard():
                             st.error(f"❌ Connection failed: {result['error']}")
                 
                 with col2:
+                    full_resync = st.checkbox("Full resync", key="t212_full_resync",
+                                              help="Walk the whole order history instead of stopping at the last synced order")
                     if st.button("🚀 Sync Transactions", type="primary", key="sync_t212"):
                         with st.spinner("Syncing..."):
-                            result = trading212.sync_all_transactions(portfolio.id)
+                            progress_bar = st.progress(0, text="Fetching order history...")
+                            
+                            def show_progress(written, total):
+                                progress_bar.progress(written / total, text=f"Saved {written}/{total} transactions")
+                            
+                            result = trading212.sync_all_transactions(portfolio.id, on_progress=show_progress,
+                                                                     full_resync=full_resync)
+                            progress_bar.empty()
                             if result["success"]:
                                 st.success(f"✅ Imported {result['imported']}, Skipped {result['skipped']}")
                             else:
@@ -654,7 +662,7 @@ def show_dashboard():
             if active_symbols:
                 if st.button("Calculate Risk Metrics", key="calc_risk"):
                     with st.spinner("Calculating..."):
-                        risk_service = RiskService()
+                        risk_service = RiskService(db)
                         
                         total_value = summary['total_value']
                         weights = []
@@ -672,6 +680,35 @@ def show_dashboard():
                                 st.metric("Sharpe Ratio", f"{metrics['portfolio']['sharpe_ratio']:.2f}")
                             with col3:
                                 st.metric("Max Drawdown", f"{metrics['portfolio']['max_drawdown']*100:.2f}%")
+                        
+                        var_report = risk_service.get_var_report(active_symbols, weights)
+                        if var_report:
+                            st.write("### Value at Risk")
+                            st.caption(f"Expected loss of the portfolio in € over {var_report['observations']} days of history")
+                            
+                            rows = []
+                            for method in ["historical", "parametric", "monte_carlo"]:
+                                var = var_report[method]["var"]["portfolio"]
+                                cvar = var_report[method]["cvar"]["portfolio"]
+                                for (horizon, confidence), value in var.items():
+                                    rows.append({
+                                        "Method": method.replace("_", " ").title(),
+                                        "Horizon": f"{horizon}d",
+                                        "Confidence": f"{confidence:.0%}",
+                                        "VaR (€)": f"€{value * total_value:,.2f}",
+                                        "CVaR (€)": f"€{cvar[(horizon, confidence)] * total_value:,.2f}"
+                                    })
+                            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+                            
+                            components = risk_service.get_component_var(active_symbols, weights)
+                            if components is not None:
+                                st.write("#### Tail Risk Contribution (95%, 1 day)")
+                                components_display = pd.DataFrame({
+                                    "Weight": components["weight"].map(lambda x: f"{x*100:.1f}%"),
+                                    "Component VaR (€)": (components["component_var"] * total_value).map(lambda x: f"€{x:,.2f}"),
+                                    "Share of VaR": components["contribution"].map(lambda x: f"{x*100:.1f}%")
+                                })
+                                st.dataframe(components_display, use_container_width=True)
             else:
                 st.info("Add holdings to see risk analysis.")
         
@@ -681,14 +718,12 @@ def show_dashboard():
             st.subheader("🎯 Risk Management")
             
             if live_positions and len(live_positions) > 0:
-                import requests
-                import time
+                from app.services.twelve_data_service import TwelveDataService, DEFAULT_OUTPUTSIZE
+                from app.services.beta_cache_service import BetaCacheService
                 
                 st.write("### Portfolio Beta Analysis")
                 st.write("Beta measures your portfolio's volatility relative to S&P 500")
                 
-                TWELVE_DATA_KEY = os.getenv("TWELVE_DATA_KEY", "3d959483e5cf4418b1a125bc85909f31")
-                
                 portfolio_tickers = []
                 portfolio_weights = []
                 portfolio_values = []
@@ -707,36 +742,8 @@ def show_dashboard():
                 
                 st.write(f"**Portfolio:** {len(portfolio_tickers)} stocks, ${total_value:,.2f} total value")
                 
-                if 'beta_cache' not in st.session_state:
-                    st.session_state.beta_cache = {}
-                if 'spy_returns_twelve' not in st.session_state:
-                    st.session_state.spy_returns_twelve = None
-                
-                def get_daily_returns_twelve(symbol):
-                    try:
-                        url = f"https://api.twelvedata.com/time_series?symbol={symbol}&interval=1day&outputsize=100&apikey={TWELVE_DATA_KEY}"
-                        r = requests.get(url, timeout=15)
-                        data = r.json()
-                        
-                        if "values" in data:
-                            prices = [float(v["close"]) for v in reversed(data["values"])]
-                            returns = [(prices[i] - prices[i-1]) / prices[i-1] for i in range(1, len(prices))]
-                            return returns
-                        else:
-                            if "message" in data:
-                                st.warning(f"{symbol}: {data['message']}")
-                            return None
-                    except Exception as e:
-                        st.error(f"{symbol} error: {str(e)}")
-                        return None
-                
-                def calculate_beta(stock_returns, market_returns):
-                    if not stock_returns or not market_returns or len(stock_returns) < 20:
-                        return None
-                    min_len = min(len(stock_returns), len(market_returns))
-                    cov = np.cov(stock_returns[-min_len:], market_returns[-min_len:])[0][1]
-                    var = np.var(market_returns[-min_len:])
-                    return cov / var if var > 0 else None
+                twelve_data = TwelveDataService()
+                beta_cache = BetaCacheService(db)
                 
                 calc_option = st.radio(
                     "Select calculation mode:",
@@ -758,53 +765,65 @@ def show_dashboard():
                 coverage = sum(top_values) / total_value * 100
                 st.info(f"📊 Will analyze {len(top_tickers)} stocks covering {coverage:.1f}% of portfolio")
                 
-                cached_count = sum(1 for t in top_tickers if t in st.session_state.beta_cache)
+                cached_betas = beta_cache.get_fresh(top_tickers, benchmark="SPY", window=DEFAULT_OUTPUTSIZE)
+                cached_count = len(cached_betas)
                 if cached_count > 0:
                     st.success(f"✅ {cached_count} stocks already cached (instant)")
                 
                 if st.button("📊 Calculate Portfolio Beta", type="primary", key="calc_beta"):
-                    if st.session_state.spy_returns_twelve is None:
-                        with st.spinner("Fetching S&P 500 data..."):
-                            st.session_state.spy_returns_twelve = get_daily_returns_twelve("SPY")
-                            time.sleep(1)
+                    betas = {ticker: entry["beta"] for ticker, entry in cached_betas.items()}
+                    failed_tickers = []
+                    
+                    # Only stale or missing tickers need the benchmark and a fetch
+                    to_fetch = [t for t in top_tickers if t not in betas]
                     
-                    spy_returns = st.session_state.spy_returns_twelve
+                    # The benchmark is cached in the database like the betas, so new sessions reuse it
+                    spy_returns = beta_cache.get_benchmark("SPY", window=DEFAULT_OUTPUTSIZE) if to_fetch else None
+                    if to_fetch and spy_returns is None:
+                        with st.spinner("Fetching S&P 500 data..."):
+                            spy_returns, spy_error = twelve_data.get_daily_returns("SPY")
+                            if spy_error:
+                                st.warning(f"SPY: {spy_error}")
+                            elif spy_returns is not None and len(spy_returns) > 0:
+                                beta_cache.store_benchmark(spy_returns, "SPY", DEFAULT_OUTPUTSIZE)
                     
-                    if spy_returns is None:
+                    if to_fetch and spy_returns is None:
                         st.error("Could not fetch S&P 500 data.")
                     else:
-                        st.success(f"✅ S&P 500: {len(spy_returns)} days of data")
-                        
-                        betas = {}
-                        failed_tickers = []
-                        
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-                        
-                        for i, ticker in enumerate(top_tickers):
-                            status_text.text(f"Processing {ticker}... ({i+1}/{len(top_tickers)})")
+                        if to_fetch:
+                            st.success(f"✅ S&P 500: {len(spy_returns)} days of data")
                             
-                            if ticker in st.session_state.beta_cache:
-                                betas[ticker] = st.session_state.beta_cache[ticker]
-                            else:
-                                stock_returns = get_daily_returns_twelve(ticker)
+                            progress_bar = st.progress(0)
+                            status_text = st.empty()
+                            
+                            def show_progress(done, total, ticker):
+                                status_text.text(f"Fetched {ticker} ({done}/{total})")
+                                progress_bar.progress(done / total)
+                            
+                            fetched_returns, fetch_errors = twelve_data.get_many_daily_returns(
+                                to_fetch, outputsize=DEFAULT_OUTPUTSIZE, on_progress=show_progress
+                            )
+                            
+                            progress_bar.empty()
+                            status_text.empty()
+                            
+                            for ticker, message in fetch_errors.items():
+                                st.warning(f"{ticker}: {message}")
+                                failed_tickers.append(ticker)
+                            
+                            if fetched_returns:
+                                # Align every series on the benchmark's trading days
+                                returns_matrix = pd.DataFrame(fetched_returns).reindex(spy_returns.index)
+                                beta_stats = RiskService(db).calculate_betas(returns_matrix, spy_returns)
                                 
-                                if stock_returns:
-                                    beta = calculate_beta(stock_returns, spy_returns)
-                                    if beta is not None:
+                                valid_stats = beta_stats[beta_stats["beta"].notna()]
+                                beta_cache.store(valid_stats, "SPY", DEFAULT_OUTPUTSIZE, spy_returns.index[-1].date())
+                                
+                                for ticker, beta in beta_stats["beta"].items():
+                                    if pd.notna(beta):
                                         betas[ticker] = beta
-                                        st.session_state.beta_cache[ticker] = beta
                                     else:
                                         failed_tickers.append(ticker)
-                                else:
-                                    failed_tickers.append(ticker)
-                                
-                                time.sleep(0.5)
-                            
-                            progress_bar.progress((i + 1) / len(top_tickers))
-                        
-                        progress_bar.empty()
-                        status_text.empty()
                         
                         if betas:
                             portfolio_beta = 0
@@ -897,10 +916,9 @@ def show_dashboard():
                         else:
                             st.error("Could not calculate beta for any stocks.")
                 
-                if st.session_state.beta_cache:
+                if beta_cache.count() > 0:
                     if st.button("🗑️ Clear Beta Cache", key="clear_beta_cache"):
-                        st.session_state.beta_cache = {}
-                        st.session_state.spy_returns_twelve = None
+                        beta_cache.clear()
                         st.success("Cache cleared!")
                         st.rerun()
             else:
@@ -0,0 +1,119 @@
+import json
+import pandas as pd
+from datetime import datetime, date, timedelta
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+from app.database.models import BetaCache, BenchmarkReturns
+
+class BetaCacheService:
+    def __init__(self, db: Session, ttl_hours: float = None):
+        self.db = db
+        self.ttl = timedelta(hours=ttl_hours if ttl_hours is not None else Config.BETA_CACHE_TTL_HOURS)
+    
+    def get_fresh(self, tickers: list, benchmark: str = "SPY", window: int = 100):
+        """Get the newest non-expired cache entry per ticker"""
+        if not tickers:
+            return {}
+        
+        cutoff = datetime.utcnow() - self.ttl
+        rows = self.db.query(BetaCache).filter(
+            BetaCache.ticker.in_(tickers),
+            BetaCache.benchmark == benchmark,
+            BetaCache.window == window,
+            BetaCache.computed_at >= cutoff
+        ).order_by(BetaCache.as_of.desc(), BetaCache.computed_at.desc()).all()
+        
+        fresh = {}
+        for row in rows:
+            if row.ticker not in fresh:
+                fresh[row.ticker] = {
+                    "beta": row.beta,
+                    "alpha": row.alpha,
+                    "r_squared": row.r_squared,
+                    "residual_vol": row.residual_vol,
+                    "observations": row.observations,
+                    "as_of": row.as_of,
+                    "computed_at": row.computed_at
+                }
+        return fresh
+    
+    def store(self, stats: pd.DataFrame, benchmark: str, window: int, as_of: date):
+        """Save RiskService.calculate_betas output, replacing entries with the same key"""
+        tickers = [str(t) for t in stats.index]
+        existing = {
+            row.ticker: row for row in self.db.query(BetaCache).filter(
+                BetaCache.ticker.in_(tickers),
+                BetaCache.benchmark == benchmark,
+                BetaCache.window == window,
+                BetaCache.as_of == as_of
+            ).all()
+        }
+        
+        now = datetime.utcnow()
+        for ticker, row in stats.iterrows():
+            entry = existing.get(str(ticker))
+            if entry is None:
+                entry = BetaCache(ticker=str(ticker), benchmark=benchmark, window=window, as_of=as_of)
+                self.db.add(entry)
+            
+            entry.beta = float(row["beta"])
+            entry.alpha = float(row["alpha"])
+            entry.r_squared = float(row["r_squared"])
+            entry.residual_vol = float(row["residual_vol"])
+            entry.observations = int(row["observations"])
+            entry.computed_at = now
+        
+        self.db.commit()
+    
+    def get_benchmark(self, benchmark: str = "SPY", window: int = 100):
+        """Newest non-expired benchmark return series, or None"""
+        cutoff = datetime.utcnow() - self.ttl
+        row = self.db.query(BenchmarkReturns).filter(
+            BenchmarkReturns.benchmark == benchmark,
+            BenchmarkReturns.window == window,
+            BenchmarkReturns.computed_at >= cutoff
+        ).order_by(BenchmarkReturns.as_of.desc(), BenchmarkReturns.computed_at.desc()).first()
+        if row is None:
+            return None
+        
+        pairs = json.loads(row.returns)
+        return pd.Series([value for _, value in pairs], index=pd.to_datetime([day for day, _ in pairs]), name=benchmark)
+    
+    def store_benchmark(self, returns: pd.Series, benchmark: str, window: int):
+        """Save a benchmark return series, replacing the entry with the same key"""
+        as_of = returns.index[-1].date()
+        entry = self.db.query(BenchmarkReturns).filter(
+            BenchmarkReturns.benchmark == benchmark,
+            BenchmarkReturns.window == window,
+            BenchmarkReturns.as_of == as_of
+        ).first()
+        if entry is None:
+            entry = BenchmarkReturns(benchmark=benchmark, window=window, as_of=as_of)
+            self.db.add(entry)
+        
+        entry.returns = json.dumps([[ts.date().isoformat(), float(value)] for ts, value in returns.items()])
+        entry.computed_at = datetime.utcnow()
+        self.db.commit()
+    
+    def count(self):
+        """Number of non-expired entries"""
+        cutoff = datetime.utcnow() - self.ttl
+        return self.db.query(BetaCache).filter(BetaCache.computed_at >= cutoff).count()
+    
+    def purge_expired(self):
+        """Delete entries past their TTL"""
+        cutoff = datetime.utcnow() - self.ttl
+        deleted = self.db.query(BetaCache).filter(BetaCache.computed_at < cutoff).delete()
+        self.db.query(BenchmarkReturns).filter(BenchmarkReturns.computed_at < cutoff).delete()
+        self.db.commit()
+        return deleted
+    
+    def clear(self):
+        """Delete every cached beta"""
+        self.db.query(BetaCache).delete()
+        self.db.query(BenchmarkReturns).delete()
+        self.db.commit()
\ No newline at end of file
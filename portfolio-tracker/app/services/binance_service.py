@@ -1,21 +1,30 @@
 import os
-import requests
 import hashlib
 import hmac
 import time
 from datetime import datetime
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
-from app.database.models import Transaction, TransactionType
+from app.database.models import TransactionType
+from app.services.import_pipeline import transaction_row, write_transactions
+from app.services.http_client import get_client
+from app.services.rate_limiter import AdaptiveRateLimiter, binance_limits, INTERACTIVE, BACKGROUND
 
 load_dotenv()
 
+# One limiter per process on the account's request weight, shared by syncs and the UI
+_limiter = AdaptiveRateLimiter(binance_limits)
+
+# Request weight of the endpoints used here
+ENDPOINT_WEIGHT = 20
+
 class BinanceService:
     def __init__(self, db: Session):
         self.db = db
         self.api_key = os.getenv('BINANCE_API_KEY')
         self.secret_key = os.getenv('BINANCE_SECRET_KEY')
         self.base_url = "https://api.binance.com"
+        self.http = get_client("binance", limiter=_limiter)
     
     def _sign(self, params: dict) -> str:
         """Create signature for Binance API"""
@@ -27,18 +36,22 @@ class BinanceService:
         ).hexdigest()
         return signature
     
-    def _request(self, endpoint: str, params: dict = None):
+    def _request(self, endpoint: str, params: dict = None, priority: int = INTERACTIVE):
         """Make signed request to Binance API"""
         if params is None:
             params = {}
         
-        params['timestamp'] = int(time.time() * 1000)
-        params['signature'] = self._sign(params)
+        def signed():
+            # Re-signed on every retry so the timestamp stays inside Binance's recvWindow
+            query = {k: v for k, v in params.items() if k not in ('timestamp', 'signature')}
+            query['timestamp'] = int(time.time() * 1000)
+            query['signature'] = self._sign(query)
+            return query
         
         headers = {'X-MBX-APIKEY': self.api_key}
         url = f"{self.base_url}{endpoint}"
         
-        response = requests.get(url, params=params, headers=headers)
+        response = self.http.get(url, params=signed, headers=headers, priority=priority, cost=ENDPOINT_WEIGHT)
         return response
     
     def test_connection(self):
@@ -57,10 +70,10 @@ class BinanceService:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def get_account_balances(self):
+    def get_account_balances(self, priority: int = INTERACTIVE):
         """Get all non-zero balances"""
         try:
-            response = self._request("/api/v3/account")
+            response = self._request("/api/v3/account", priority=priority)
             if response.status_code == 200:
                 data = response.json()
                 balances = []
@@ -79,22 +92,23 @@ class BinanceService:
         except:
             return []
     
-    def get_trade_history(self, symbol: str, limit: int = 1000):
+    def get_trade_history(self, symbol: str, limit: int = 1000, priority: int = INTERACTIVE):
         """Get trade history for a specific symbol"""
         try:
             params = {"symbol": symbol, "limit": limit}
-            response = self._request("/api/v3/myTrades", params)
+            response = self._request("/api/v3/myTrades", params, priority=priority)
             if response.status_code == 200:
                 return response.json()
             return []
         except:
             return []
     
-    def get_all_trades(self):
+    def get_all_trades(self, priority: int = INTERACTIVE):
         """Get trades for all traded symbols"""
         try:
             # First get exchange info for all symbols
-            info_response = requests.get(f"{self.base_url}/api/v3/exchangeInfo")
+            info_response = self.http.get(f"{self.base_url}/api/v3/exchangeInfo", priority=priority,
+                                          cost=ENDPOINT_WEIGHT)
             if info_response.status_code != 200:
                 return []
             
@@ -105,7 +119,7 @@ class BinanceService:
             common_quotes = ["USDT", "BTC", "EUR", "BUSD", "USDC"]
             
             # Get account balances to find which assets user has traded
-            balances = self.get_account_balances()
+            balances = self.get_account_balances(priority)
             user_assets = [b["asset"] for b in balances]
             
             # Also check deposit/withdraw history for assets
@@ -115,7 +129,7 @@ class BinanceService:
                 for quote in common_quotes:
                     symbol = f"{asset}{quote}"
                     if symbol in symbols and symbol not in checked_symbols:
-                        trades = self.get_trade_history(symbol)
+                        trades = self.get_trade_history(symbol, priority=priority)
                         all_trades.extend(trades)
                         checked_symbols.add(symbol)
             
@@ -124,14 +138,15 @@ class BinanceService:
             print(f"Error: {e}")
             return []
     
-    def sync_all_transactions(self, portfolio_id: int):
+    def sync_all_transactions(self, portfolio_id: int, on_progress=None):
         """Sync all Binance trades to database"""
         imported = 0
         skipped = 0
         errors = []
+        rows = []
         
         try:
-            trades = self.get_all_trades()
+            trades = self.get_all_trades(BACKGROUND)
             
             for trade in trades:
                 try:
@@ -151,37 +166,17 @@ class BinanceService:
                     
                     tx_type = TransactionType.BUY if is_buyer else TransactionType.SELL
                     
-                    # Check for duplicate
-                    existing = self.db.query(Transaction).filter(
-                        Transaction.portfolio_id == portfolio_id,
-                        Transaction.symbol == base_asset,
-                        Transaction.quantity == qty,
-                        Transaction.price == price,
-                        Transaction.date == tx_date
-                    ).first()
-                    
-                    if existing:
-                        skipped += 1
-                        continue
-                    
                     commission = float(trade.get("commission", 0))
-                    
-                    transaction = Transaction(
-                        portfolio_id=portfolio_id,
-                        symbol=base_asset,
-                        transaction_type=tx_type,
-                        quantity=qty,
-                        price=price,
-                        fee=commission,
-                        date=tx_date
-                    )
-                    
-                    self.db.add(transaction)
-                    imported += 1
+                    trade_id = trade.get("id")
+                    rows.append(transaction_row(portfolio_id, base_asset, tx_type, qty, price, commission, tx_date,
+                                                external_id=f"binance:{symbol}:{trade_id}" if trade_id is not None else None))
                     
                 except Exception as e:
                     errors.append(f"Trade error: {str(e)}")
             
+            # Rows already stored are dropped by write_transactions' prefetch; the unique index only guards races
+            imported = write_transactions(self.db, portfolio_id, rows, on_progress=on_progress)
+            skipped += len(rows) - imported
             self.db.commit()
             
             return {
@@ -1,127 +1,173 @@
-import pandas as pd
+import io
+import multiprocessing
 import pdfplumber
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import repeat
 from sqlalchemy.orm import Session
-from app.database.models import Transaction, Portfolio, TransactionType
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+from app.database.models import Portfolio, TransactionType
+from app.services.import_pipeline import (transaction_row, write_transactions, stream_csv_import,
+                                          content_hash, start_import_job)
+
+# Trading212 CSV exports: "Time" is usually ISO, older exports use day/month/year
+T212_CSV_COLUMNS = {
+    "action": "Action",
+    "symbol": "Ticker",
+    "quantity": "No. of shares",
+    "price": "Price / share",
+    "date": "Time",
+    "fee": None
+}
+T212_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S", "ISO8601")
+
+# Trading212 statement lines, compiled once
+# 2025-11-03 (tarih tek başına)
+PDF_DATE_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2})$')
+# 2025-11-03 11:00:03 IREN AU0000185993 USD ... Buy/Sell (eski format)
+PDF_FULL_TRADE = re.compile(r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})\s+([A-Z0-9]{1,6})\s+\w+\s+\w+\s+\d+\s+\d+\s+(Buy|Sell)\s+([\d.]+)\s+([\d.]+)')
+# 2025-11-03 SYMBOL ... (tarih inline)
+PDF_DATE_INLINE = re.compile(r'^(\d{4}-\d{2}-\d{2})\s+([A-Z0-9]{1,6})')
+# SOFI US83406F1021 USD 25951185699 25951185777 Buy 4 15.19 ... (yeni format - tarih ayrı satırda)
+PDF_SYMBOL_TRADE = re.compile(r'^([A-Z0-9]{1,6})\s+.*?(Buy|Sell)\s+([\d.]+)\s+([\d.]+)')
+PDF_TIME = re.compile(r'(\d{2}:\d{2}:\d{2})')
+
+def classify_statement_line(line: str):
+    """Classify one statement line: ("date", day), ("trade", date, time, symbol, type, qty, price) or None"""
+    # A trade without its own date has date None and takes the last date line seen
+    stripped = line.strip()
+    if PDF_DATE_LINE.match(stripped):
+        return ("date", stripped)
+    
+    if line[:1].isdigit():
+        full_match = PDF_FULL_TRADE.match(line)
+        if full_match:
+            date_str, symbol, direction, qty_str, price_str = full_match.groups()
+            tx_type = TransactionType.BUY if direction == 'Buy' else TransactionType.SELL
+            return ("trade", datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S'), None, symbol, tx_type,
+                    float(qty_str), float(price_str))
+        
+        # A line starting with a date can not also start with a symbol
+        date_inline = PDF_DATE_INLINE.match(line)
+        if date_inline:
+            return ("date", date_inline.group(1))
+    
+    if 'Buy' in line or 'Sell' in line:
+        match = PDF_SYMBOL_TRADE.match(line)
+        if match:
+            symbol, direction, qty_str, price_str = match.groups()
+            time_match = PDF_TIME.search(line)
+            tx_type = TransactionType.BUY if direction == 'Buy' else TransactionType.SELL
+            return ("trade", None, time_match.group(1) if time_match else None, symbol, tx_type,
+                    float(qty_str), float(price_str))
+    return None
+
+def _parse_statement_pages(data: bytes, page_numbers):
+    """Extract and classify a range of pages; one event list per page"""
+    pages = []
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        for number in page_numbers:
+            events = []
+            for line in (pdf.pages[number].extract_text() or "").split('\n'):
+                try:
+                    event = classify_statement_line(line)
+                except Exception as e:
+                    event = ("error", f"Line parse error: {str(e)}")
+                if event:
+                    events.append(event)
+            pages.append(events)
+    return pages
+
+def parse_trading212_statement(data: bytes, workers: int = None):
+    """Statement events in page order, with pages of long statements parsed across a process pool"""
+    # Every worker re-opens the whole document, so a typical few-page monthly statement is not worth
+    # the process startup. Workers are spawned, not forked, as the Streamlit server is multithreaded.
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        page_count = len(pdf.pages)
+    workers = min(workers or Config.IMPORT_PDF_WORKERS or os.cpu_count() or 1,
+                  page_count // max(Config.IMPORT_PDF_PAGES_PER_WORKER, 1))
+    
+    if workers <= 1:
+        pages = _parse_statement_pages(data, range(page_count))
+    else:
+        # Contiguous page ranges, so each process opens the document once
+        step = -(-page_count // workers)
+        ranges = [range(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            pages = [page for chunk in executor.map(_parse_statement_pages, repeat(data), ranges) for page in chunk]
+    
+    return [event for events in pages for event in events]
+
+def _read_bytes(file_content):
+    if isinstance(file_content, (bytes, bytearray)):
+        return bytes(file_content)
+    if isinstance(file_content, str):
+        with open(file_content, "rb") as f:
+            return f.read()
+    file_content.seek(0)
+    return file_content.read()
 
 class ImportService:
     def __init__(self, db: Session):
         self.db = db
     
-    def import_trading212_pdf(self, file_content, portfolio_id: int):
+    def import_trading212_pdf(self, file_content, portfolio_id: int, on_progress=None, workers: int = None):
         """Import transactions from Trading212 Monthly Statement PDF"""
         try:
-            imported = 0
-            skipped = 0
+            data = _read_bytes(file_content)
+            
+            # A statement that was already imported is recognised by its hash, before any parsing
+            job = start_import_job(self.db, portfolio_id, "trading212_pdf", content_hash(data))
+            if job.status == "completed":
+                return {
+                    "success": True,
+                    "imported": 0,
+                    "skipped": 0,
+                    "errors": [],
+                    "already_imported": True
+                }
+            
             errors = []
+            rows = []
+            current_date = None
             
-            with pdfplumber.open(file_content) as pdf:
-                current_date = None
-                
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if not text:
-                        continue
-                    
-                    lines = text.split('\n')
-                    for line in lines:
+            # Pages come back in order, so a date line carries over to the trades on following pages
+            for event in parse_trading212_statement(data, workers):
+                kind = event[0]
+                if kind == "date":
+                    current_date = event[1]
+                elif kind == "error":
+                    errors.append(event[1])
+                else:
+                    _, tx_date, time_str, symbol, tx_type, quantity, price = event
+                    if tx_date is None:
+                        if not current_date:
+                            continue
                         try:
-                            # Pattern 1: Tarih satırını yakala (YYYY-MM-DD formatında tek başına)
-                            date_match = re.match(r'^(\d{4}-\d{2}-\d{2})$', line.strip())
-                            if date_match:
-                                current_date = date_match.group(1)
-                                continue
-                            
-                            # Pattern 2: Tarih + Symbol aynı satırda (eski format)
-                            # 2025-11-03 11:00:03 IREN AU0000185993 USD ... Buy/Sell
-                            full_match = re.match(r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})\s+([A-Z0-9]{1,6})\s+\w+\s+\w+\s+\d+\s+\d+\s+(Buy|Sell)\s+([\d.]+)\s+([\d.]+)', line)
-                            if full_match:
-                                date_str, symbol, direction, qty_str, price_str = full_match.groups()
-                                tx_date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                                quantity = float(qty_str)
-                                price = float(price_str)
-                                
-                                # Check duplicate
-                                existing = self.db.query(Transaction).filter(
-                                    Transaction.portfolio_id == portfolio_id,
-                                    Transaction.symbol == symbol,
-                                    Transaction.quantity == quantity,
-                                    Transaction.price == price,
-                                    Transaction.date == tx_date
-                                ).first()
-                                
-                                if existing:
-                                    skipped += 1
-                                    continue
-                                
-                                tx_type = TransactionType.BUY if direction == 'Buy' else TransactionType.SELL
-                                
-                                transaction = Transaction(
-                                    portfolio_id=portfolio_id,
-                                    symbol=symbol,
-                                    transaction_type=tx_type,
-                                    quantity=quantity,
-                                    price=price,
-                                    fee=0,
-                                    date=tx_date
-                                )
-                                self.db.add(transaction)
-                                imported += 1
-                                continue
-                            
-                            # Pattern 3: Tarih inline ile başlıyor (YYYY-MM-DD SYMBOL ...)
-                            date_inline = re.match(r'^(\d{4}-\d{2}-\d{2})\s+([A-Z0-9]{1,6})', line)
-                            if date_inline:
-                                current_date = date_inline.group(1)
-                            
-                            # Pattern 4: Symbol ile başlayan satır (yeni format - tarih ayrı satırda)
-                            # SOFI US83406F1021 USD 25951185699 25951185777 Buy 4 15.19 ...
-                            if 'Buy' in line or 'Sell' in line:
-                                match = re.match(r'^([A-Z0-9]{1,6})\s+.*?(Buy|Sell)\s+([\d.]+)\s+([\d.]+)', line)
-                                if match and current_date:
-                                    symbol, direction, qty_str, price_str = match.groups()
-                                    
-                                    # Saat bilgisi varsa al, yoksa 00:00:00 kullan
-                                    time_match = re.search(r'(\d{2}:\d{2}:\d{2})', line)
-                                    if time_match:
-                                        tx_date = datetime.strptime(f"{current_date} {time_match.group(1)}", '%Y-%m-%d %H:%M:%S')
-                                    else:
-                                        tx_date = datetime.strptime(current_date, '%Y-%m-%d')
-                                    
-                                    quantity = float(qty_str)
-                                    price = float(price_str)
-                                    
-                                    # Check duplicate
-                                    existing = self.db.query(Transaction).filter(
-                                        Transaction.portfolio_id == portfolio_id,
-                                        Transaction.symbol == symbol,
-                                        Transaction.quantity == quantity,
-                                        Transaction.price == price,
-                                        Transaction.date == tx_date
-                                    ).first()
-                                    
-                                    if existing:
-                                        skipped += 1
-                                        continue
-                                    
-                                    tx_type = TransactionType.BUY if direction == 'Buy' else TransactionType.SELL
-                                    
-                                    transaction = Transaction(
-                                        portfolio_id=portfolio_id,
-                                        symbol=symbol,
-                                        transaction_type=tx_type,
-                                        quantity=quantity,
-                                        price=price,
-                                        fee=0,
-                                        date=tx_date
-                                    )
-                                    self.db.add(transaction)
-                                    imported += 1
-                        
+                            # Saat bilgisi varsa al, yoksa 00:00:00 kullan
+                            if time_str:
+                                tx_date = datetime.strptime(f"{current_date} {time_str}", '%Y-%m-%d %H:%M:%S')
+                            else:
+                                tx_date = datetime.strptime(current_date, '%Y-%m-%d')
                         except Exception as e:
                             errors.append(f"Line parse error: {str(e)}")
+                            continue
+                    rows.append(transaction_row(portfolio_id, symbol, tx_type, quantity, price, 0, tx_date))
+            
+            # Rows already stored are dropped by write_transactions' prefetch; the unique index only guards races
+            imported = write_transactions(self.db, portfolio_id, rows, on_progress=on_progress)
+            skipped = len(rows) - imported
             
+            job.status = "completed"
+            job.rows_committed = len(rows)
+            job.imported = imported
+            job.skipped = skipped
+            job.error_count = len(errors)
             self.db.commit()
             
             return {
@@ -132,6 +178,7 @@ class ImportService:
             }
             
         except Exception as e:
+            self.db.rollback()
             return {
                 "success": False,
                 "error": str(e),
@@ -139,81 +186,16 @@ class ImportService:
                 "skipped": 0
             }
     
-    def import_trading212_csv(self, file_content, portfolio_id: int):
+    def import_trading212_csv(self, file_content, portfolio_id: int, on_progress=None, chunk_rows: int = None):
         """Import transactions from Trading212 CSV export"""
+        # Streamed in chunks and resumable; see stream_csv_import
         try:
-            df = pd.read_csv(file_content)
-            
-            imported = 0
-            skipped = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    action = str(row.get('Action', '')).lower()
-                    
-                    if 'buy' in action:
-                        tx_type = TransactionType.BUY
-                    elif 'sell' in action:
-                        tx_type = TransactionType.SELL
-                    else:
-                        skipped += 1
-                        continue
-                    
-                    symbol = str(row.get('Ticker', '')).strip()
-                    if not symbol:
-                        skipped += 1
-                        continue
-                    
-                    quantity = float(row.get('No. of shares', 0))
-                    price = float(row.get('Price / share', 0))
-                    
-                    time_str = row.get('Time', '')
-                    try:
-                        tx_date = datetime.strptime(str(time_str), '%Y-%m-%d %H:%M:%S')
-                    except:
-                        try:
-                            tx_date = datetime.strptime(str(time_str), '%d/%m/%Y %H:%M:%S')
-                        except:
-                            tx_date = datetime.utcnow()
-                    
-                    existing = self.db.query(Transaction).filter(
-                        Transaction.portfolio_id == portfolio_id,
-                        Transaction.symbol == symbol,
-                        Transaction.date == tx_date,
-                        Transaction.quantity == quantity
-                    ).first()
-                    
-                    if existing:
-                        skipped += 1
-                        continue
-                    
-                    transaction = Transaction(
-                        portfolio_id=portfolio_id,
-                        symbol=symbol,
-                        transaction_type=tx_type,
-                        quantity=quantity,
-                        price=price,
-                        fee=0,
-                        date=tx_date
-                    )
-                    
-                    self.db.add(transaction)
-                    imported += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {index}: {str(e)}")
-            
-            self.db.commit()
-            
-            return {
-                "success": True,
-                "imported": imported,
-                "skipped": skipped,
-                "errors": errors
-            }
+            return stream_csv_import(self.db, file_content, portfolio_id, "trading212_csv",
+                                     T212_CSV_COLUMNS, T212_TIME_FORMATS,
+                                     chunk_rows=chunk_rows, on_progress=on_progress)
             
         except Exception as e:
+            self.db.rollback()
             return {
                 "success": False,
                 "error": str(e),
@@ -221,70 +203,27 @@ class ImportService:
                 "skipped": 0
             }
     
-    def import_generic_csv(self, file_content, portfolio_id: int, column_mapping: dict):
+    def import_generic_csv(self, file_content, portfolio_id: int, column_mapping: dict, on_progress=None,
+                           chunk_rows: int = None):
         """Import transactions from generic CSV with custom column mapping"""
         try:
-            df = pd.read_csv(file_content)
-            
-            imported = 0
-            skipped = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    action = str(row.get(column_mapping.get('action', 'Action'), '')).lower()
-                    
-                    if 'buy' in action or 'kauf' in action:
-                        tx_type = TransactionType.BUY
-                    elif 'sell' in action or 'verkauf' in action:
-                        tx_type = TransactionType.SELL
-                    else:
-                        skipped += 1
-                        continue
-                    
-                    symbol = str(row.get(column_mapping.get('symbol', 'Symbol'), '')).strip()
-                    if not symbol:
-                        skipped += 1
-                        continue
-                    
-                    quantity = float(row.get(column_mapping.get('quantity', 'Quantity'), 0))
-                    price = float(row.get(column_mapping.get('price', 'Price'), 0))
-                    fee = float(row.get(column_mapping.get('fee', 'Fee'), 0) or 0)
-                    
-                    date_str = row.get(column_mapping.get('date', 'Date'), '')
-                    date_format = column_mapping.get('date_format', '%Y-%m-%d')
-                    
-                    try:
-                        tx_date = datetime.strptime(str(date_str), date_format)
-                    except:
-                        tx_date = datetime.utcnow()
-                    
-                    transaction = Transaction(
-                        portfolio_id=portfolio_id,
-                        symbol=symbol,
-                        transaction_type=tx_type,
-                        quantity=quantity,
-                        price=price,
-                        fee=fee,
-                        date=tx_date
-                    )
-                    
-                    self.db.add(transaction)
-                    imported += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {index}: {str(e)}")
-            
-            self.db.commit()
-            
-            return {
-                "success": True,
-                "imported": imported,
-                "skipped": skipped,
-                "errors": errors
+            columns = {
+                "action": column_mapping.get('action', 'Action'),
+                "symbol": column_mapping.get('symbol', 'Symbol'),
+                "quantity": column_mapping.get('quantity', 'Quantity'),
+                "price": column_mapping.get('price', 'Price'),
+                "date": column_mapping.get('date', 'Date'),
+                "fee": column_mapping.get('fee', 'Fee')
             }
+            date_formats = (column_mapping.get('date_format', '%Y-%m-%d'),)
+            
+            # German exports say Kauf/Verkauf; sell is matched first because "verkauf" contains "kauf"
+            return stream_csv_import(self.db, file_content, portfolio_id, "generic_csv", columns, date_formats,
+                                     buy_words=("buy", "kauf"), sell_words=("sell", "verkauf"),
+                                     chunk_rows=chunk_rows, on_progress=on_progress)
             
         except Exception as e:
+            self.db.rollback()
             return {
                 "success": False,
                 "error": str(e),
@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+from app.services.rate_limiter import INTERACTIVE
+
+# Responses worth another attempt: rate limited or a transient server error
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class HttpClient:
+    """Pooled keep-alive session for one API with default timeouts and jittered retry/backoff"""
+    
+    def __init__(self, pool_size: int = None, timeout=None, max_retries: int = None,
+                 backoff_base: float = None, backoff_max: float = None, limiter=None):
+        self.timeout = timeout or (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+        self.max_retries = Config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base or Config.HTTP_BACKOFF_BASE
+        self.backoff_max = backoff_max or Config.HTTP_BACKOFF_MAX
+        # Optional AdaptiveRateLimiter fed by every response's headers
+        self.limiter = limiter
+        
+        # pool_block caps the open connections per host; extra threads wait for a free one
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size or Config.HTTP_POOL_SIZE, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    def backoff(self, attempt: int):
+        """Full jitter: uniform between zero and the capped exponential delay"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+    
+    def request(self, method: str, url: str, priority: int = INTERACTIVE, cost: float = 1, **kwargs):
+        """Send a request, retrying connection errors, 429 and 5xx; returns the last response"""
+        # params may be a callable building fresh params per attempt, e.g. a signed timestamp.
+        # A Retry-After longer than backoff_max is not waited out: that response is returned.
+        # priority and cost (e.g. Binance request weight) are passed to the limiter.
+        kwargs.setdefault("timeout", self.timeout)
+        params = kwargs.pop("params", None)
+        key = self.limiter.key_for(url) if self.limiter else None
+        
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire(key, priority, cost)
+            try:
+                response = self.session.request(method, url, params=params() if callable(params) else params, **kwargs)
+            except Exception as e:
+                if self.limiter:
+                    self.limiter.observe(key, None, cost)
+                if not isinstance(e, (requests.ConnectionError, requests.Timeout)) or attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+            
+            if self.limiter:
+                self.limiter.observe(key, response, cost)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            
+            wait = self._retry_after(response)
+            if wait is None:
+                wait = self.backoff(attempt)
+            elif wait > self.backoff_max:
+                return response
+            response.close()
+            time.sleep(wait)
+    
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(name: str, **kwargs):
+    """Shared client for one API, so every service instance and thread reuses its connections"""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = HttpClient(**kwargs)
+        return client
\ No newline at end of file
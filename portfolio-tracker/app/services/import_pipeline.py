@@ -0,0 +1,370 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import insert, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+from app.database.models import Transaction, TransactionType, RealizedPnL, ImportJob, transaction_fingerprint, transaction_key
+from app.services.portfolio_service import PortfolioService
+
+def transaction_row(portfolio_id: int, symbol: str, tx_type: TransactionType, quantity: float,
+                    price: float, fee: float, date: datetime, external_id: str = None, occurrence: int = 0):
+    """Column values for one imported trade, including its dedup fingerprint"""
+    # external_id is the broker's trade/order id (namespaced, e.g. binance:BTCUSDT:42) when the source has one
+    return {
+        "portfolio_id": portfolio_id,
+        "symbol": symbol,
+        "transaction_type": tx_type,
+        "quantity": quantity,
+        "price": price,
+        "fee": fee,
+        "date": date,
+        "created_at": datetime.utcnow(),
+        "external_id": external_id,
+        "fingerprint": transaction_fingerprint(portfolio_id, symbol, tx_type, quantity, price, date,
+                                               occurrence, external_id)
+    }
+
+def _column(df: pd.DataFrame, name: str, default):
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index)
+
+def parse_dates(values: pd.Series, formats):
+    """Parse with each explicit format in turn, only retrying the rows that are still unparsed"""
+    # Values with an offset or a Z (ISO8601, %z) are converted to naive UTC, like the broker API
+    # timestamps; naive values are kept as written
+    text = values.astype(str).str.strip()
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for fmt in formats:
+        missing = dates.isna()
+        if not missing.any():
+            break
+        parsed = pd.to_datetime(text[missing], format=fmt, errors="coerce", utc=True)
+        dates[missing] = parsed.dt.tz_convert(None)
+    return dates
+
+def parse_trade_frame(df: pd.DataFrame, columns: dict, date_formats, buy_words=("buy",), sell_words=("sell",)):
+    """Vectorized trade parsing; returns (trades, errors, skipped)"""
+    # columns maps action/symbol/quantity/price/date/fee to CSV headers. trades has symbol,
+    # transaction_type, quantity, price, fee and date; errors has the CSV row index and a message.
+    # Rows that are not trades (deposits, dividends, ...) or have no symbol are counted as skipped.
+    action = _column(df, columns["action"], "").fillna("").astype(str).str.lower()
+    is_sell = action.str.contains("|".join(sell_words), regex=True)
+    is_buy = action.str.contains("|".join(buy_words), regex=True) & ~is_sell
+    
+    symbol = _column(df, columns["symbol"], "").fillna("").astype(str).str.strip()
+    is_trade = (is_buy | is_sell) & (symbol != "")
+    skipped = int((~is_trade).sum())
+    
+    quantity = pd.to_numeric(_column(df, columns["quantity"], 0), errors="coerce")
+    price = pd.to_numeric(_column(df, columns["price"], 0), errors="coerce")
+    fee = pd.to_numeric(_column(df, columns["fee"], 0), errors="coerce").fillna(0) if columns.get("fee") else pd.Series(0.0, index=df.index)
+    raw_dates = _column(df, columns["date"], "")
+    dates = parse_dates(raw_dates, date_formats)
+    
+    problem = np.select(
+        [quantity.isna(), price.isna(), dates.isna()],
+        ["Invalid quantity", "Invalid price", "Unparseable date"],
+        default=""
+    )
+    invalid = is_trade & (problem != "")
+    errors = pd.DataFrame({
+        "row": df.index[invalid],
+        "error": [f"{message}: {value!r}" if message == "Unparseable date" else message
+                  for message, value in zip(problem[invalid], raw_dates[invalid])]
+    })
+    
+    valid = is_trade & ~invalid
+    trades = pd.DataFrame({
+        "symbol": symbol[valid],
+        "transaction_type": np.where(is_buy[valid], TransactionType.BUY, TransactionType.SELL),
+        "quantity": quantity[valid].astype(float),
+        "price": price[valid].astype(float),
+        "fee": fee[valid].astype(float),
+        "date": dates[valid]
+    })
+    return trades, errors, skipped
+
+def frame_rows(portfolio_id: int, trades: pd.DataFrame):
+    """Insert rows for a parsed trade frame"""
+    return [
+        transaction_row(portfolio_id, symbol, tx_type, quantity, price, fee, tx_date)
+        for symbol, tx_type, quantity, price, fee, tx_date in zip(
+            trades["symbol"].tolist(), trades["transaction_type"].tolist(),
+            trades["quantity"].tolist(), trades["price"].tolist(), trades["fee"].tolist(),
+            [ts.to_pydatetime() for ts in trades["date"]]
+        )
+    ]
+
+def error_messages(errors: pd.DataFrame):
+    return [f"Row {row}: {error}" for row, error in zip(errors["row"], errors["error"])]
+
+def next_occurrence(occurrences: dict, portfolio_id: int, row):
+    """Number of identical rows counted before this one, counting it too"""
+    # Counts are grouped by date so a streamed import can drop the dates it has moved past
+    counts = occurrences.setdefault(row["date"], {})
+    key = transaction_key(portfolio_id, row["symbol"], row["transaction_type"], row["quantity"],
+                          row["price"], row["date"])
+    occurrence = counts.get(key, 0)
+    counts[key] = occurrence + 1
+    return occurrence
+
+def prune_occurrences(occurrences: dict, rows: list):
+    """Keep only the counts for dates inside the rows' date range"""
+    # In a file sorted by date (either way) identical rows are adjacent, so only the dates at the
+    # edge of the last chunk can repeat in the next one
+    if not rows:
+        return
+    dates = [row["date"] for row in rows]
+    first, last = min(dates), max(dates)
+    for date in [date for date in occurrences if date < first or date > last]:
+        del occurrences[date]
+
+def existing_fingerprints(db: Session, portfolio_id: int, rows: list):
+    """Stored fingerprints and the natural-key fingerprints of broker-synced rows, in one query"""
+    # Synced rows answer for their natural key too (identical ones numbered in id order), so a
+    # file import of trades that an API sync already stored does not double them
+    if not rows:
+        return set(), set()
+    dates = [row["date"] for row in rows]
+    stored = db.query(
+        Transaction.fingerprint, Transaction.external_id, Transaction.symbol, Transaction.transaction_type,
+        Transaction.quantity, Transaction.price, Transaction.date
+    ).filter(
+        Transaction.portfolio_id == portfolio_id,
+        Transaction.date >= min(dates),
+        Transaction.date <= max(dates)
+    ).order_by(Transaction.id)
+    
+    fingerprints = set()
+    synced = set()
+    occurrences = {}
+    for fingerprint, external_id, symbol, tx_type, quantity, price, tx_date in stored:
+        fingerprints.add(fingerprint)
+        if external_id:
+            row = {"symbol": symbol, "transaction_type": tx_type, "quantity": quantity, "price": price, "date": tx_date}
+            synced.add(transaction_fingerprint(portfolio_id, symbol, tx_type, quantity, price, tx_date,
+                                               next_occurrence(occurrences, portfolio_id, row)))
+    return fingerprints, synced
+
+def filter_new_rows(db: Session, portfolio_id: int, rows: list, occurrences: dict = None):
+    """Number identical rows by occurrence and drop the ones already stored"""
+    # Identical rows are separate trades (e.g. two fills at the same price and second), so the n-th
+    # copy in a file is fingerprinted as occurrence n. occurrences carries the counts across the
+    # chunks of one file. A row with a broker id is also matched on its natural key against rows
+    # without one, which catches the same trade imported from a file or stored before ids were kept.
+    stored, synced = existing_fingerprints(db, portfolio_id, rows)
+    occurrences = {} if occurrences is None else occurrences
+    new_rows = []
+    for row in rows:
+        natural = transaction_fingerprint(portfolio_id, row["symbol"], row["transaction_type"], row["quantity"],
+                                          row["price"], row["date"], next_occurrence(occurrences, portfolio_id, row))
+        if row.get("external_id"):
+            if row["fingerprint"] in stored or natural in stored:
+                continue
+        else:
+            row["fingerprint"] = natural
+            if natural in stored or natural in synced:
+                continue
+        stored.add(row["fingerprint"])
+        new_rows.append(row)
+    return new_rows
+
+def existing_order_ids(db: Session, records: list):
+    """Order ids stored within the date range of a batch of RealizedPnL records, in one query"""
+    # An order's date is its creation time, so a stored record falls inside the range; undated
+    # records are looked up by id
+    if not records:
+        return set()
+    dates = [record.order_date for record in records if record.order_date]
+    undated = [record.order_id for record in records if not record.order_date]
+    conditions = []
+    if dates:
+        conditions.append(and_(RealizedPnL.order_date >= min(dates), RealizedPnL.order_date <= max(dates)))
+    if undated:
+        conditions.append(RealizedPnL.order_id.in_(undated))
+    return {order_id for order_id, in db.query(RealizedPnL.order_id).filter(or_(*conditions))}
+
+def insert_ignore_duplicates(db: Session):
+    """INSERT that silently skips rows whose fingerprint already exists"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(Transaction.__table__).on_conflict_do_nothing(index_elements=["fingerprint"])
+    if dialect == "postgresql":
+        return postgresql.insert(Transaction.__table__).on_conflict_do_nothing(index_elements=["fingerprint"])
+    return insert(Transaction.__table__).prefix_with("IGNORE")
+
+def insert_chunk(db: Session, statement, chunk: list):
+    """Execute one chunk of the ignore-duplicates INSERT; returns how many rows landed"""
+    # executemany rowcount is -1 or unreliable on some drivers (psycopg2), so RETURNING is used where
+    # the dialect supports it, rowcount where the dialect vouches for it, and a count query otherwise
+    dialect = db.get_bind().dialect
+    if dialect.insert_executemany_returning:
+        return len(db.execute(statement.returning(Transaction.__table__.c.fingerprint), chunk).all())
+    if dialect.supports_sane_multi_rowcount:
+        return db.execute(statement, chunk).rowcount
+    
+    stored = db.query(Transaction.id).filter(Transaction.fingerprint.in_([row["fingerprint"] for row in chunk]))
+    before = stored.count()
+    db.execute(statement, chunk)
+    return stored.count() - before
+
+def write_transactions(db: Session, portfolio_id: int, rows: list, chunk_size: int = None, on_progress=None,
+                       occurrences: dict = None, commit: bool = True):
+    """Bulk insert trade rows in chunks, committing each one; returns how many were new"""
+    # Each chunk is one executemany of a Core INSERT (no ORM objects), folded into the holdings
+    # and committed, so an interrupted import keeps every finished chunk. With commit=False chunks
+    # are only flushed and the caller commits the whole batch at once.
+    # on_progress(written, total) runs after each chunk.
+    # One prefetch query filters the batch in memory; the unique index still guards against races.
+    # occurrences is passed on to filter_new_rows when one file is written in several batches.
+    rows = filter_new_rows(db, portfolio_id, rows, occurrences)
+    if not rows:
+        return 0
+    
+    # Oldest first, so each chunk extends the holdings incrementally instead of forcing a replay
+    rows.sort(key=lambda row: row["date"])
+    
+    chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+    statement = insert_ignore_duplicates(db)
+    portfolio_service = PortfolioService(db)
+    inserted = 0
+    
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        landed = insert_chunk(db, statement, chunk)
+        if landed == len(chunk):
+            portfolio_service.apply_new_transactions(portfolio_id, chunk)
+        elif landed > 0:
+            # A concurrent import won some rows; recompute instead of guessing which
+            portfolio_service.rebuild_holdings(portfolio_id, {row["symbol"] for row in chunk})
+        inserted += landed
+        if commit:
+            db.commit()
+        else:
+            db.flush()
+        
+        if on_progress:
+            on_progress(start + len(chunk), len(rows))
+    
+    return inserted
+
+def content_hash(file_content):
+    """SHA-256 of an uploaded file (bytes or a seekable file object), leaving the file rewound"""
+    digest = hashlib.sha256()
+    if isinstance(file_content, (bytes, bytearray)):
+        digest.update(file_content)
+        return digest.hexdigest()
+    
+    file_content.seek(0)
+    while True:
+        block = file_content.read(1 << 20)
+        if not block:
+            break
+        digest.update(block.encode() if isinstance(block, str) else block)
+    file_content.seek(0)
+    return digest.hexdigest()
+
+def start_import_job(db: Session, portfolio_id: int, source: str, digest: str):
+    """Existing job for this file (to skip or resume) or a new running one"""
+    job = db.query(ImportJob).filter(
+        ImportJob.portfolio_id == portfolio_id,
+        ImportJob.source == source,
+        ImportJob.content_hash == digest
+    ).first()
+    if job is None:
+        job = ImportJob(portfolio_id=portfolio_id, source=source, content_hash=digest, status="running",
+                        rows_committed=0, imported=0, skipped=0, error_count=0)
+        db.add(job)
+        db.commit()
+    return job
+
+def _file_size(file_content):
+    try:
+        position = file_content.tell()
+        size = file_content.seek(0, 2)
+        file_content.seek(position)
+        return size
+    except Exception:
+        return None
+
+def stream_csv_import(db: Session, file_content, portfolio_id: int, source: str, columns: dict, date_formats,
+                      buy_words=("buy",), sell_words=("sell",), chunk_rows: int = None, on_progress=None):
+    """Read a CSV in chunks, parsing and bulk-writing each one, resumable by file hash"""
+    # Memory stays bounded by chunk_rows and IMPORT_MAX_ERRORS. After every chunk the job records how many
+    # input rows are committed; uploading the same file again resumes after them, or returns at once
+    # if it already completed. on_progress(rows_committed, fraction_of_file) runs after each chunk.
+    chunk_rows = chunk_rows or Config.IMPORT_CSV_CHUNK_ROWS
+    digest = content_hash(file_content)
+    job = start_import_job(db, portfolio_id, source, digest)
+    
+    if job.status == "completed":
+        return {
+            "success": True,
+            "imported": 0,
+            "skipped": 0,
+            "errors": [],
+            "error_rows": pd.DataFrame(columns=["row", "error"]),
+            "error_count": 0,
+            "already_imported": True
+        }
+    
+    resumed_from = job.rows_committed
+    size = _file_size(file_content)
+    errors = []
+    error_frames = []
+    # Identical rows are numbered across the whole file, so committed rows are still parsed on resume.
+    # Counts are pruned to the last chunk's dates, keeping memory bounded by the chunk size.
+    occurrences = {}
+    
+    for chunk in pd.read_csv(file_content, chunksize=chunk_rows):
+        if chunk.index[0] < resumed_from:
+            committed = chunk[chunk.index < resumed_from]
+            trades = parse_trade_frame(committed, columns, date_formats, buy_words, sell_words)[0]
+            rows = frame_rows(portfolio_id, trades)
+            for row in rows:
+                next_occurrence(occurrences, portfolio_id, row)
+            prune_occurrences(occurrences, rows)
+            chunk = chunk[chunk.index >= resumed_from]
+            if chunk.empty:
+                continue
+        
+        trades, error_rows, skipped = parse_trade_frame(chunk, columns, date_formats, buy_words, sell_words)
+        rows = frame_rows(portfolio_id, trades)
+        imported = write_transactions(db, portfolio_id, rows, occurrences=occurrences)
+        prune_occurrences(occurrences, rows)
+        
+        room = Config.IMPORT_MAX_ERRORS - len(errors)
+        if room > 0 and len(error_rows):
+            error_frames.append(error_rows.head(room))
+            errors.extend(error_messages(error_rows.head(room)))
+        
+        job.rows_committed += len(chunk)
+        job.imported += imported
+        job.skipped += skipped + len(rows) - imported
+        job.error_count += len(error_rows)
+        db.commit()
+        
+        if on_progress:
+            fraction = min(file_content.tell() / size, 1.0) if size else None
+            on_progress(job.rows_committed, fraction)
+    
+    job.status = "completed"
+    db.commit()
+    
+    return {
+        "success": True,
+        "imported": job.imported,
+        "skipped": job.skipped,
+        "errors": errors,
+        "error_rows": pd.concat(error_frames, ignore_index=True) if error_frames else pd.DataFrame(columns=["row", "error"]),
+        "error_count": job.error_count,
+        "resumed_from": resumed_from
+    }
\ No newline at end of file
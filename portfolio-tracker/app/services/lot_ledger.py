@@ -0,0 +1,125 @@
+from collections import deque
+
+FIFO = "fifo"
+LIFO = "lifo"
+AVERAGE = "average"
+METHODS = (FIFO, LIFO, AVERAGE)
+
+class Lot:
+    """Open quantity bought at one price"""
+    __slots__ = ("quantity", "price", "date")
+    
+    def __init__(self, quantity: float, price: float, date=None):
+        self.quantity = quantity
+        self.price = price
+        self.date = date
+    
+    def __repr__(self):
+        return f"Lot({self.quantity}, {self.price}, {self.date})"
+
+class LotMatch:
+    """Part of a sell closed against one lot"""
+    __slots__ = ("symbol", "quantity", "buy_price", "sell_price", "buy_date", "sell_date")
+    
+    def __init__(self, symbol: str, quantity: float, buy_price: float, sell_price: float,
+                 buy_date=None, sell_date=None):
+        self.symbol = symbol
+        self.quantity = quantity
+        self.buy_price = buy_price
+        self.sell_price = sell_price
+        self.buy_date = buy_date
+        self.sell_date = sell_date
+    
+    @property
+    def pnl(self):
+        return (self.sell_price - self.buy_price) * self.quantity
+    
+    def __repr__(self):
+        return f"LotMatch({self.symbol}, {self.quantity}, {self.buy_price} -> {self.sell_price})"
+
+class LotLedger:
+    """Per-symbol lot queues matching sells to buys by FIFO, LIFO or average cost in O(1) per lot"""
+    
+    def __init__(self, method: str = FIFO, keep_matches: bool = True):
+        if method not in METHODS:
+            raise ValueError(f"Unknown lot matching method: {method}")
+        self.method = method
+        self.keep_matches = keep_matches
+        self.lots = {}
+        self.realized_pnl = {}
+        self.matches = []
+    
+    def _queue(self, symbol: str):
+        lots = self.lots.get(symbol)
+        if lots is None:
+            lots = self.lots[symbol] = deque()
+            self.realized_pnl[symbol] = 0
+        return lots
+    
+    def buy(self, symbol: str, quantity: float, price: float, date=None):
+        lots = self._queue(symbol)
+        if self.method == AVERAGE and lots:
+            # Average cost keeps a single pooled lot per symbol
+            pooled = lots[0]
+            total = pooled.quantity + quantity
+            if total > 0:
+                pooled.price = (pooled.quantity * pooled.price + quantity * price) / total
+            pooled.quantity = total
+        else:
+            lots.append(Lot(quantity, price, date))
+    
+    def sell(self, symbol: str, quantity: float, price: float, date=None):
+        """Close up to `quantity` against open lots; returns the PnL realized by this sell"""
+        # Quantity beyond the open lots is ignored, as is a non-positive quantity
+        lots = self._queue(symbol)
+        remaining = quantity
+        realized = self.realized_pnl
+        before = realized[symbol]
+        take_last = self.method == LIFO
+        
+        while remaining > 0 and lots:
+            lot = lots[-1] if take_last else lots[0]
+            
+            if lot.quantity <= remaining:
+                # Use entire lot
+                used = lot.quantity
+                if take_last:
+                    lots.pop()
+                else:
+                    lots.popleft()
+            else:
+                # Partial use of lot
+                used = remaining
+                lot.quantity -= remaining
+            
+            realized[symbol] += (price - lot.price) * used
+            remaining -= used
+            if self.keep_matches:
+                self.matches.append(LotMatch(symbol, used, lot.price, price, lot.date, date))
+        
+        return realized[symbol] - before
+    
+    def restore(self, symbol: str, lots: list, realized_pnl: float = 0):
+        """Seed a symbol with saved open lots (oldest first) and its realized PnL so far"""
+        queue = self._queue(symbol)
+        queue.clear()
+        queue.extend(lots)
+        self.realized_pnl[symbol] = realized_pnl
+    
+    def add(self, symbol: str, is_buy: bool, quantity: float, price: float, date=None):
+        if is_buy:
+            self.buy(symbol, quantity, price, date)
+        else:
+            self.sell(symbol, quantity, price, date)
+    
+    def open_lots(self, symbol: str = None):
+        """Open lots oldest first, for one symbol or as a dict for all"""
+        if symbol is not None:
+            return list(self.lots.get(symbol, ()))
+        return {s: list(lots) for s, lots in self.lots.items() if lots}
+    
+    def open_quantity(self, symbol: str):
+        return sum(lot.quantity for lot in self.lots.get(symbol, ()))
+    
+    def matches_for(self, symbol: str):
+        return [match for match in self.matches if match.symbol == symbol]
\ No newline at end of file
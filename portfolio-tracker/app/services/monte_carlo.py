@@ -0,0 +1,269 @@
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+TRADING_DAYS = 252
+
+# Paths simulated per block; bounds the temporary shock buffer to block_size x days
+DEFAULT_BLOCK_SIZE = 2000
+
+# Streaming mode: paths per chunk (one chunk = one seeded shard) and the percentiles reported for fan charts
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Multi-asset mode: target number of floats held per chunk (paths x steps x assets)
+CHUNK_FLOATS = 4_000_000
+
+# Quantile sketch resolution: bins per row, covering +/- SKETCH_WIDTH standard deviations of log value
+SKETCH_BINS = 512
+SKETCH_WIDTH = 8.0
+# Sketch means are accumulated as exact integers in units of 2**-SUM_FRACTION_BITS
+SUM_FRACTION_BITS = 64
+
+def make_rng(seed=None):
+    """Create a numpy Generator from a seed, SeedSequence or existing Generator"""
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+def simulate_paths(current_value: float, daily_return: float, daily_vol: float,
+                   days: int, simulations: int, rng: np.random.Generator,
+                   block_size: int = DEFAULT_BLOCK_SIZE):
+    """Simulate value paths where each day's value is the previous one times (1 + shock)"""
+    results = np.empty((simulations, days))
+    results[:, 0] = current_value
+    if days < 2:
+        return results
+    
+    for start in range(0, simulations, block_size):
+        stop = min(start + block_size, simulations)
+        growth = rng.standard_normal((stop - start, days - 1))
+        growth *= daily_vol
+        growth += 1 + daily_return
+        np.cumprod(growth, axis=1, out=growth)
+        growth *= current_value
+        results[start:stop, 1:] = growth
+    
+    return results
+
+class QuantileSketch:
+    """Fixed-size histogram of log values per row (day, asset, ...) that can be updated and merged"""
+    
+    def __init__(self, center, scale, bins: int = SKETCH_BINS, width: float = SKETCH_WIDTH):
+        center = np.asarray(center, dtype=float)
+        scale = np.maximum(np.asarray(scale, dtype=float), 1e-9)
+        
+        self.bins = bins
+        self.lower = center - width * scale
+        self.bin_width = 2 * width * scale / bins
+        self.counts = np.zeros((len(center), bins), dtype=np.int64)
+        # Exact fixed-point sums (Python ints): integer addition is associative, so the mean does not
+        # depend on how chunks were grouped across workers, and the size stays fixed
+        self.sums = np.array([0] * len(center), dtype=object)
+        self.total = 0
+    
+    def update(self, values: np.ndarray):
+        """Add a (samples x rows) block of positive values"""
+        rows = self.counts.shape[0]
+        scaled = np.ldexp(values.sum(axis=0), SUM_FRACTION_BITS)
+        self.sums += np.array([int(round(s)) for s in scaled.tolist()], dtype=object)
+        self.total += values.shape[0]
+        
+        logs = np.log(np.maximum(values, 1e-12))
+        logs -= self.lower
+        logs /= self.bin_width
+        idx = logs.astype(np.intp)
+        np.clip(idx, 0, self.bins - 1, out=idx)
+        idx += np.arange(rows) * self.bins
+        
+        self.counts += np.bincount(idx.ravel(), minlength=rows * self.bins).reshape(rows, self.bins)
+    
+    def merge(self, other: "QuantileSketch"):
+        """Fold another sketch with the same bin layout into this one"""
+        self.counts += other.counts
+        self.sums += other.sums
+        self.total += other.total
+        return self
+    
+    def mean(self):
+        if not self.total:
+            return np.zeros(self.counts.shape[0])
+        return np.ldexp(np.array([float(s) for s in self.sums]), -SUM_FRACTION_BITS) / self.total
+    
+    def quantiles(self, percentiles=DEFAULT_PERCENTILES):
+        """Approximate quantiles per row, interpolating inside the bin; shape (len(percentiles), rows)"""
+        cdf = np.cumsum(self.counts, axis=1)
+        rows = np.arange(self.counts.shape[0])
+        out = np.empty((len(percentiles), len(rows)))
+        
+        for i, p in enumerate(percentiles):
+            target = p / 100 * self.total
+            k = np.minimum((cdf < target).sum(axis=1), self.bins - 1)
+            below = np.where(k > 0, cdf[rows, np.maximum(k - 1, 0)], 0)
+            in_bin = self.counts[rows, k]
+            frac = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.5)
+            out[i] = np.exp(self.lower + (k + frac) * self.bin_width)
+        
+        return out
+
+def log_value_bounds(current_value: float, daily_return: float, daily_vol: float, days: int):
+    """Expected log value and its standard deviation for each simulated day"""
+    t = np.arange(days)
+    center = np.log(current_value) + t * (np.log1p(daily_return) - 0.5 * daily_vol ** 2)
+    scale = daily_vol * np.sqrt(t)
+    return center, scale
+
+def _path_quantiles_shard(params: dict, rng: np.random.Generator, n: int):
+    """Simulate one shard of single-asset paths into a fresh sketch"""
+    sketch = QuantileSketch(params["center"], params["scale"])
+    paths = simulate_paths(params["current_value"], params["daily_return"], params["daily_vol"],
+                           params["days"], n, rng, block_size=n)
+    sketch.update(paths)
+    terminal = paths[:, -1].copy() if params["keep_terminal"] else None
+    return [sketch], terminal
+
+def _run_shards(shard_fn, params: dict, shards: list):
+    """Run contiguous shards in order and merge them; executed in-process or in a pool worker"""
+    merged = None
+    extras = []
+    for child, n in shards:
+        sketches, extra = shard_fn(params, np.random.default_rng(child), n)
+        if merged is None:
+            merged = sketches
+        else:
+            for total, part in zip(merged, sketches):
+                total.merge(part)
+        if extra is not None:
+            extras.append(extra)
+    return merged, extras
+
+def run_sharded(shard_fn, params: dict, simulations: int, chunk_size: int, seed=None, workers: int = None):
+    """Split paths into seeded shards, optionally spread over processes, and merge the sketches in shard order"""
+    # Shard seeds come from SeedSequence(seed).spawn, so for a given seed and chunk_size
+    # the merged result is identical whatever the number of workers. Workers are spawned rather
+    # than forked, since the Streamlit server that calls this is multithreaded.
+    sizes = [min(chunk_size, simulations - start) for start in range(0, simulations, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    shards = list(zip(seeds, sizes))
+    
+    if workers is None or workers <= 1 or len(shards) == 1:
+        groups = [shards]
+    else:
+        n_groups = min(workers, len(shards))
+        bounds = np.linspace(0, len(shards), n_groups + 1).astype(int)
+        groups = [shards[bounds[i]:bounds[i + 1]] for i in range(n_groups)]
+    
+    if len(groups) == 1:
+        partials = [_run_shards(shard_fn, params, groups[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(groups), mp_context=multiprocessing.get_context("spawn")) as executor:
+            partials = list(executor.map(_run_shards, [shard_fn] * len(groups), [params] * len(groups), groups))
+    
+    merged, extras = partials[0]
+    for sketches, more in partials[1:]:
+        for total, part in zip(merged, sketches):
+            total.merge(part)
+        extras.extend(more)
+    return merged, extras
+
+def simulate_quantiles(current_value: float, daily_return: float, daily_vol: float,
+                       days: int, simulations: int, seed=None,
+                       percentiles=DEFAULT_PERCENTILES, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       keep_terminal: bool = True, workers: int = None):
+    """Simulate in chunks, keeping only per-day quantile bands and terminal values"""
+    center, scale = log_value_bounds(current_value, daily_return, daily_vol, days)
+    params = {
+        "current_value": current_value,
+        "daily_return": daily_return,
+        "daily_vol": daily_vol,
+        "days": days,
+        "center": center,
+        "scale": scale,
+        "keep_terminal": keep_terminal
+    }
+    
+    (sketch,), terminals = run_sharded(_path_quantiles_shard, params, simulations, chunk_size,
+                                        seed=seed, workers=workers)
+    terminal = np.concatenate(terminals) if keep_terminal else None
+    
+    return {
+        "percentiles": list(percentiles),
+        "bands": sketch.quantiles(percentiles),
+        "mean": sketch.mean(),
+        "terminal_values": terminal,
+        "terminal_percentiles": (np.percentile(terminal, percentiles) if keep_terminal
+                                 else sketch.quantiles(percentiles)[:, -1])
+    }
+
+def factor_covariance(cov: np.ndarray):
+    """Return A with A @ A.T == cov; Cholesky when positive definite, eigen factors otherwise"""
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # Fewer observations than assets gives a singular covariance matrix
+        vals, vecs = np.linalg.eigh(cov)
+        keep = vals > max(vals.max(), 0) * 1e-10
+        return vecs[:, keep] * np.sqrt(vals[keep])
+
+def _portfolio_quantiles_shard(params: dict, rng: np.random.Generator, n: int):
+    """Simulate one shard of correlated asset paths into fresh portfolio/asset sketches"""
+    values = params["values"]
+    loading = params["loading"]
+    steps = params["steps"]
+    
+    portfolio_sketch = QuantileSketch(params["portfolio_center"], params["portfolio_scale"])
+    asset_sketch = QuantileSketch(params["asset_center"], params["asset_scale"])
+    
+    growth = rng.standard_normal((n, steps, loading.shape[0])) @ loading
+    growth += params["drift"]
+    np.cumsum(growth, axis=1, out=growth)
+    np.exp(growth, out=growth)
+    
+    paths = np.empty((n, steps + 1))
+    paths[:, 0] = values.sum()
+    paths[:, 1:] = growth @ values
+    portfolio_sketch.update(paths)
+    asset_sketch.update(growth[:, -1, :] * values)
+    return [portfolio_sketch, asset_sketch], None
+
+def simulate_portfolio_quantiles(values: np.ndarray, mean_log: np.ndarray, cov: np.ndarray,
+                                 steps: int, step_days: int, simulations: int, seed=None,
+                                 percentiles=DEFAULT_PERCENTILES, chunk_size: int = None,
+                                 workers: int = None):
+    """Simulate correlated buy-and-hold asset paths in batches; keep portfolio bands and asset terminal quantiles"""
+    values = np.asarray(values, dtype=float)
+    total = values.sum()
+    weights = values / total
+    
+    factor = factor_covariance(cov)
+    n_assets = len(values)
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_FLOATS // (steps * max(n_assets, factor.shape[1])))
+    
+    t = np.arange(steps + 1) * step_days
+    asset_var = np.diag(cov)
+    horizon = steps * step_days
+    params = {
+        "values": values,
+        "loading": factor.T * np.sqrt(step_days),
+        "drift": mean_log * step_days,
+        "steps": steps,
+        "portfolio_center": np.log(total) + t * (weights @ mean_log),
+        "portfolio_scale": np.sqrt(t * (weights @ asset_var)),
+        "asset_center": np.log(np.maximum(values, 1e-12)) + horizon * mean_log,
+        "asset_scale": np.sqrt(horizon * asset_var)
+    }
+    
+    (portfolio_sketch, asset_sketch), _ = run_sharded(_portfolio_quantiles_shard, params, simulations,
+                                                      chunk_size, seed=seed, workers=workers)
+    
+    portfolio_bands = portfolio_sketch.quantiles(percentiles)
+    return {
+        "percentiles": list(percentiles),
+        "days": t,
+        "bands": portfolio_bands,
+        "mean": portfolio_sketch.mean(),
+        "terminal_percentiles": portfolio_bands[:, -1],
+        "asset_terminal_percentiles": asset_sketch.quantiles(percentiles).T,
+        "asset_terminal_mean": asset_sketch.mean()
+    }
\ No newline at end of file
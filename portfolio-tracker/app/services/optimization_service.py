@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 from pypfopt import EfficientFrontier, risk_models, expected_returns
 from pypfopt.discrete_allocation import DiscreteAllocation, get_latest_prices
+from sqlalchemy.orm import Session
 import sys
 import os
 
@@ -9,20 +10,15 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from app.services.risk_service import RiskService
 
 class OptimizationService:
-    def __init__(self):
-        self.risk_service = RiskService()
+    def __init__(self, db: Session = None):
+        self.risk_service = RiskService(db)
     
     def get_price_data(self, symbols: list):
-        """Get historical price data for multiple symbols"""
-        all_prices = {}
+        """Get aligned historical price data for multiple symbols from the shared returns panel"""
+        panel = self.risk_service.get_returns_panel(symbols)
         
-        for symbol in symbols:
-            prices = self.risk_service.get_historical_prices(symbol)
-            if prices is not None and len(prices) > 0:
-                all_prices[symbol] = prices
-        
-        if all_prices:
-            return pd.DataFrame(all_prices).dropna()
+        if not panel.empty:
+            return panel.prices_frame().dropna()
         return None
     
     def optimize_max_sharpe(self, symbols: list, risk_free_rate: float = 0.05):
@@ -1,6 +1,18 @@
+import json
 from datetime import datetime
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
-from app.database.models import Transaction, Portfolio, TransactionType
+from app.database.models import Transaction, Portfolio, TransactionType, Holding, transaction_fingerprint
+from app.services.lot_ledger import Lot, LotLedger, FIFO
+
+# Rows fetched per round trip when streaming transactions as tuples
+STREAM_BATCH_SIZE = 1000
+
+# Summed fractional shares leave float dust (e.g. 5.7e-14) on closed positions; below this they count as zero
+QUANTITY_EPSILON = 1e-9
+
+def _snap_quantity(quantity: float):
+    return 0.0 if abs(quantity) < QUANTITY_EPSILON else quantity
 
 class PortfolioService:
     def __init__(self, db: Session):
@@ -14,6 +26,13 @@ class PortfolioService:
             date = datetime.utcnow()
         
         tx_type = TransactionType.BUY if transaction_type.lower() == "buy" else TransactionType.SELL
+        # A manual entry is never a duplicate: an identical trade gets the next free occurrence
+        occurrence = 0
+        while True:
+            fingerprint = transaction_fingerprint(portfolio_id, symbol, tx_type, quantity, price, date, occurrence)
+            if not self.db.query(Transaction.id).filter(Transaction.fingerprint == fingerprint).first():
+                break
+            occurrence += 1
         
         transaction = Transaction(
             portfolio_id=portfolio_id,
@@ -22,10 +41,13 @@ class PortfolioService:
             quantity=quantity,
             price=price,
             fee=fee,
-            date=date
+            date=date,
+            fingerprint=fingerprint
         )
         
         self.db.add(transaction)
+        self.db.flush()
+        self.apply_to_holdings(transaction)
         self.db.commit()
         return transaction
     
@@ -62,48 +84,198 @@ class PortfolioService:
         
         return holdings
     
-    def calculate_realized_pnl(self, portfolio_id: int):
-        """Calculate realized PnL using FIFO method"""
-        transactions = self.db.query(Transaction).filter(
-            Transaction.portfolio_id == portfolio_id
-        ).order_by(Transaction.date.asc()).all()
+    def _dump_lots(self, lots):
+        return json.dumps([[lot.quantity, lot.price, lot.date.isoformat() if lot.date else None] for lot in lots])
+    
+    def _load_lots(self, data: str):
+        return [Lot(q, p, datetime.fromisoformat(d) if d else None) for q, p, d in json.loads(data or "[]")]
+    
+    def apply_to_holdings(self, tx: Transaction):
+        """Fold one new transaction into its materialized holding"""
+        self.apply_new_transactions(tx.portfolio_id, [{
+            "symbol": tx.symbol,
+            "transaction_type": tx.transaction_type,
+            "quantity": tx.quantity,
+            "price": tx.price,
+            "fee": tx.fee,
+            "date": tx.date
+        }])
+    
+    def apply_new_transactions(self, portfolio_id: int, rows: list):
+        """Fold newly inserted transaction rows into the holdings; symbols that get back-dated rows are replayed"""
+        # rows are dicts with symbol, transaction_type, quantity, price, fee and date, already flushed/inserted
+        by_symbol = {}
+        for row in sorted(rows, key=lambda r: r["date"]):
+            by_symbol.setdefault(row["symbol"], []).append(row)
         
-        # FIFO queues per symbol
-        buy_queues = {}
-        realized_pnl = {}
+        holdings = {h.symbol: h for h in self.db.query(Holding).filter(
+            Holding.portfolio_id == portfolio_id,
+            Holding.symbol.in_(list(by_symbol))
+        )}
         
-        for tx in transactions:
-            symbol = tx.symbol
-            if symbol not in buy_queues:
-                buy_queues[symbol] = []
-                realized_pnl[symbol] = 0
+        if not holdings and self.db.query(Holding.id).filter(Holding.portfolio_id == portfolio_id).first() is None:
+            # Table not populated for this portfolio yet
+            self.rebuild_holdings(portfolio_id)
+            return
+        
+        stale = []
+        for symbol, symbol_rows in by_symbol.items():
+            holding = holdings.get(symbol)
+            if holding is not None and holding.last_tx_date and symbol_rows[0]["date"] < holding.last_tx_date:
+                # Lot order would change, so replay the symbol
+                stale.append(symbol)
+                continue
             
-            if tx.transaction_type == TransactionType.BUY:
-                buy_queues[symbol].append({
-                    "quantity": tx.quantity,
-                    "price": tx.price
-                })
+            if holding is None:
+                holding = Holding(portfolio_id=portfolio_id, symbol=symbol,
+                                  quantity=0, total_cost=0, fees=0, realized_pnl=0, open_lots="[]")
+                self.db.add(holding)
+            
+            ledger = LotLedger(FIFO, keep_matches=False)
+            ledger.restore(symbol, self._load_lots(holding.open_lots), holding.realized_pnl or 0)
+            
+            for row in symbol_rows:
+                if row["transaction_type"] == TransactionType.BUY:
+                    holding.quantity += row["quantity"]
+                    holding.total_cost += (row["quantity"] * row["price"])
+                    holding.fees += row["fee"] or 0
+                    ledger.buy(symbol, row["quantity"], row["price"], row["date"])
+                else:  # SELL
+                    holding.quantity -= row["quantity"]
+                    ledger.sell(symbol, row["quantity"], row["price"], row["date"])
+            
+            holding.quantity = _snap_quantity(holding.quantity)
+            holding.realized_pnl = ledger.realized_pnl[symbol]
+            holding.open_lots = self._dump_lots(ledger.open_lots(symbol))
+            holding.last_tx_date = symbol_rows[-1]["date"]
+        
+        if stale:
+            self.rebuild_holdings(portfolio_id, stale)
+        else:
+            self.db.flush()
+    
+    def rebuild_holdings(self, portfolio_id: int, symbols=None, commit: bool = False):
+        """Recompute materialized holdings from transactions, for some symbols or the whole portfolio"""
+        stale = self.db.query(Holding).filter(Holding.portfolio_id == portfolio_id)
+        if symbols is not None:
+            symbols = list(symbols)
+            stale = stale.filter(Holding.symbol.in_(symbols))
+        
+        rows, ledger = self.summarize_transactions(portfolio_id, symbols)
+        
+        stale.delete()
+        for symbol, row in rows.items():
+            self.db.add(Holding(
+                portfolio_id=portfolio_id,
+                symbol=symbol,
+                realized_pnl=ledger.realized_pnl[symbol],
+                open_lots=self._dump_lots(ledger.open_lots(symbol)),
+                **row
+            ))
+        
+        if commit:
+            self.db.commit()
+        else:
+            self.db.flush()
+        return len(rows)
+    
+    def get_holdings(self, portfolio_id: int):
+        """Current holdings from the materialized holdings table (same shape as calculate_holdings)"""
+        rows = self.db.query(Holding).filter(Holding.portfolio_id == portfolio_id).all()
+        
+        if not rows and self.db.query(Transaction.id).filter(Transaction.portfolio_id == portfolio_id).first():
+            # First read after an upgrade: populate from the transaction history once
+            self.rebuild_holdings(portfolio_id, commit=True)
+            rows = self.db.query(Holding).filter(Holding.portfolio_id == portfolio_id).all()
+        
+        holdings = {}
+        for row in rows:
+            # Rows written before dust was snapped may still hold it
+            quantity = _snap_quantity(row.quantity)
+            holdings[row.symbol] = {
+                "quantity": quantity,
+                "total_cost": row.total_cost,
+                "fees": row.fees,
+                "avg_cost": row.total_cost / quantity if quantity > 0 else 0,
+                "realized_pnl": row.realized_pnl
+            }
+        return holdings
+    
+    def _stream_transactions(self, portfolio_id: int, symbols=None):
+        """Portfolio transactions oldest first as lightweight (symbol, type, quantity, price, fee, date) rows"""
+        query = self.db.query(
+            Transaction.symbol, Transaction.transaction_type, Transaction.quantity,
+            Transaction.price, Transaction.fee, Transaction.date
+        ).filter(Transaction.portfolio_id == portfolio_id)
+        if symbols is not None:
+            query = query.filter(Transaction.symbol.in_(list(symbols)))
+        return query.order_by(Transaction.date.asc()).yield_per(STREAM_BATCH_SIZE)
+    
+    def summarize_transactions(self, portfolio_id: int, symbols=None, method: str = FIFO):
+        """One streamed pass producing quantity/cost/fee totals per symbol and the lot ledger"""
+        ledger = LotLedger(method, keep_matches=False)
+        rows = {}
+        buy = TransactionType.BUY
+        
+        for symbol, tx_type, quantity, price, fee, tx_date in self._stream_transactions(portfolio_id, symbols):
+            row = rows.get(symbol)
+            if row is None:
+                row = rows[symbol] = {"quantity": 0, "total_cost": 0, "fees": 0, "last_tx_date": None}
+            
+            if tx_type == buy:
+                row["quantity"] += quantity
+                row["total_cost"] += (quantity * price)
+                row["fees"] += fee or 0
+                ledger.buy(symbol, quantity, price, tx_date)
             else:  # SELL
-                qty_to_sell = tx.quantity
-                sell_price = tx.price
-                
-                while qty_to_sell > 0 and buy_queues[symbol]:
-                    oldest_buy = buy_queues[symbol][0]
-                    
-                    if oldest_buy["quantity"] <= qty_to_sell:
-                        # Use entire buy lot
-                        pnl = (sell_price - oldest_buy["price"]) * oldest_buy["quantity"]
-                        realized_pnl[symbol] += pnl
-                        qty_to_sell -= oldest_buy["quantity"]
-                        buy_queues[symbol].pop(0)
-                    else:
-                        # Partial use of buy lot
-                        pnl = (sell_price - oldest_buy["price"]) * qty_to_sell
-                        realized_pnl[symbol] += pnl
-                        oldest_buy["quantity"] -= qty_to_sell
-                        qty_to_sell = 0
-        
-        return realized_pnl
+                row["quantity"] -= quantity
+                ledger.sell(symbol, quantity, price, tx_date)
+            row["last_tx_date"] = tx_date
+        
+        for row in rows.values():
+            row["quantity"] = _snap_quantity(row["quantity"])
+        return rows, ledger
+    
+    def aggregate_holdings(self, portfolio_id: int, method: str = FIFO):
+        """Quantity, cost and fee totals per symbol via GROUP BY in the database; lots replayed only where sold"""
+        is_buy = Transaction.transaction_type == TransactionType.BUY
+        rows = self.db.query(
+            Transaction.symbol,
+            func.sum(case((is_buy, Transaction.quantity), else_=-Transaction.quantity)),
+            func.sum(case((is_buy, Transaction.quantity * Transaction.price), else_=0)),
+            func.sum(case((is_buy, func.coalesce(Transaction.fee, 0)), else_=0)),
+            func.sum(case((is_buy, 0), else_=1))
+        ).filter(
+            Transaction.portfolio_id == portfolio_id
+        ).group_by(Transaction.symbol).all()
+        
+        sold = [symbol for symbol, _, _, _, sells in rows if sells]
+        ledger = self.build_lot_ledger(portfolio_id, method, keep_matches=False, symbols=sold) if sold else None
+        
+        holdings = {}
+        for symbol, quantity, total_cost, fees, sells in rows:
+            quantity = _snap_quantity(quantity)
+            holdings[symbol] = {
+                "quantity": quantity,
+                "total_cost": total_cost,
+                "fees": fees,
+                "avg_cost": total_cost / quantity if quantity > 0 else 0,
+                # Without sells nothing is realized, so those symbols skip lot matching entirely
+                "realized_pnl": ledger.realized_pnl.get(symbol, 0) if sells else 0
+            }
+        return holdings
+    
+    def build_lot_ledger(self, portfolio_id: int, method: str = FIFO, keep_matches: bool = True, symbols=None):
+        """Replay transactions oldest first into a lot ledger (open lots, closed matches, realized PnL)"""
+        ledger = LotLedger(method, keep_matches=keep_matches)
+        for symbol, tx_type, quantity, price, fee, tx_date in self._stream_transactions(portfolio_id, symbols):
+            ledger.add(symbol, tx_type == TransactionType.BUY, quantity, price, tx_date)
+        
+        return ledger
+    
+    def calculate_realized_pnl(self, portfolio_id: int, method: str = FIFO):
+        """Calculate realized PnL per symbol using FIFO (or LIFO / average cost)"""
+        return self.build_lot_ledger(portfolio_id, method, keep_matches=False).realized_pnl
     
     def calculate_unrealized_pnl(self, holdings: dict, current_prices: dict):
         """Calculate unrealized PnL based on current prices"""
@@ -117,10 +289,29 @@ class PortfolioService:
         
         return unrealized_pnl
     
-    def get_portfolio_summary(self, portfolio_id: int, current_prices: dict):
+    def get_portfolio_summary(self, portfolio_id: int, current_prices: dict, source: str = "holdings",
+                              holdings: dict = None):
         """Get complete portfolio summary"""
-        holdings = self.calculate_holdings(portfolio_id)
-        realized_pnl = self.calculate_realized_pnl(portfolio_id)
+        # source: "holdings" reads the materialized table, "sql" aggregates in the database,
+        # "transactions" replays the history in a single streamed pass.
+        # Pass holdings already read with get_holdings to skip a second query.
+        if holdings is None:
+            if source == "sql":
+                holdings = self.aggregate_holdings(portfolio_id)
+            elif source == "transactions":
+                rows, ledger = self.summarize_transactions(portfolio_id)
+                holdings = {}
+                for symbol, row in rows.items():
+                    holdings[symbol] = {
+                        "quantity": row["quantity"],
+                        "total_cost": row["total_cost"],
+                        "fees": row["fees"],
+                        "avg_cost": row["total_cost"] / row["quantity"] if row["quantity"] > 0 else 0,
+                        "realized_pnl": ledger.realized_pnl[symbol]
+                    }
+            else:
+                holdings = self.get_holdings(portfolio_id)
+        realized_pnl = {symbol: data["realized_pnl"] for symbol, data in holdings.items()}
         unrealized_pnl = self.calculate_unrealized_pnl(holdings, current_prices)
         
         total_value = sum(
@@ -0,0 +1,177 @@
+import pandas as pd
+from alpha_vantage.timeseries import TimeSeries
+from datetime import datetime, date, timedelta
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+from app.database.connection import SessionLocal
+from app.database.models import PriceHistory, PriceSymbol
+
+# Alpha Vantage column -> price_history column
+AV_COLUMNS = {
+    "1. open": "open",
+    "2. high": "high",
+    "3. low": "low",
+    "4. close": "close",
+    "5. volume": "volume"
+}
+
+# Compact responses cover the last 100 trading days
+COMPACT_TRADING_DAYS = 100
+
+class PriceStore:
+    """Local OHLCV store; only missing trailing days are fetched from Alpha Vantage"""
+    
+    # Set once the key has rejected outputsize=full, so later fetches go straight to compact
+    full_rejected = False
+    
+    def __init__(self, db: Session = None):
+        self.db = db if db is not None else SessionLocal()
+        self._ts = None
+    
+    @property
+    def ts(self):
+        """Alpha Vantage client, created on first fetch so reading from disk needs no API key"""
+        if self._ts is None:
+            self._ts = TimeSeries(key=Config.ALPHA_VANTAGE_API_KEY, output_format='pandas')
+        return self._ts
+    
+    def _last_trading_day(self):
+        """Most recent weekday before today (today's bar may not be final yet)"""
+        day = date.today() - timedelta(days=1)
+        while day.weekday() >= 5:
+            day -= timedelta(days=1)
+        return day
+    
+    def _is_stale(self, state: PriceSymbol):
+        """Check whether a symbol needs a refresh from the provider"""
+        # A symbol with no stored bars is throttled by last_fetched_at too, so a ticker the
+        # provider cannot serve is asked about once per PRICE_REFRESH_HOURS, not on every call
+        if state is None:
+            return True
+        if state.last_date is not None and state.last_date >= self._last_trading_day():
+            return False
+        if state.last_fetched_at is None:
+            return True
+        age = datetime.utcnow() - state.last_fetched_at
+        return age > timedelta(hours=Config.PRICE_REFRESH_HOURS)
+    
+    def _fetch_daily(self, symbol: str, state: PriceSymbol):
+        """Fetch daily bars newer than what is stored"""
+        outputsize = 'compact'
+        if Config.PRICE_FULL_HISTORY and not PriceStore.full_rejected:
+            if state is None or state.last_date is None:
+                outputsize = 'full'
+            elif len(pd.bdate_range(state.last_date, date.today())) > COMPACT_TRADING_DAYS:
+                outputsize = 'full'
+        
+        try:
+            data, meta = self.ts.get_daily(symbol=symbol, outputsize=outputsize)
+        except Exception:
+            if outputsize == 'compact':
+                return None
+            # 'full' is a premium feature on some keys, fall back to compact
+            try:
+                data, meta = self.ts.get_daily(symbol=symbol, outputsize='compact')
+            except Exception:
+                return None
+            # Compact worked, so it was the key that rejected 'full': stop asking for it
+            PriceStore.full_rejected = True
+        
+        data = data.sort_index().rename(columns=AV_COLUMNS)
+        if state is not None and state.last_date is not None:
+            data = data[data.index.date > state.last_date]
+        return data
+    
+    def refresh(self, symbol: str, force: bool = False):
+        """Append missing trailing days for a symbol. Returns number of new rows."""
+        state = self.db.get(PriceSymbol, symbol)
+        
+        if not force and not self._is_stale(state):
+            return 0
+        
+        data = self._fetch_daily(symbol, state)
+        
+        if state is None:
+            state = PriceSymbol(symbol=symbol)
+            self.db.add(state)
+        state.last_fetched_at = datetime.utcnow()
+        
+        added = 0
+        if data is not None and not data.empty:
+            rows = []
+            for ts, bar in data.iterrows():
+                rows.append(PriceHistory(
+                    symbol=symbol,
+                    date=ts.date(),
+                    open=bar.get("open"),
+                    high=bar.get("high"),
+                    low=bar.get("low"),
+                    close=bar["close"],
+                    volume=bar.get("volume")
+                ))
+            self.db.add_all(rows)
+            added = len(rows)
+            
+            if state.first_date is None:
+                state.first_date = data.index[0].date()
+            state.last_date = data.index[-1].date()
+        
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            return 0
+        return added
+    
+    def get_history(self, symbol: str, start: date = None, end: date = None, refresh: bool = True):
+        """Get stored OHLCV bars for a symbol as a DataFrame indexed by date"""
+        if refresh:
+            self.refresh(symbol)
+        
+        query = self.db.query(
+            PriceHistory.date, PriceHistory.open, PriceHistory.high,
+            PriceHistory.low, PriceHistory.close, PriceHistory.volume
+        ).filter(PriceHistory.symbol == symbol)
+        if start is not None:
+            query = query.filter(PriceHistory.date >= start)
+        if end is not None:
+            query = query.filter(PriceHistory.date <= end)
+        
+        rows = query.order_by(PriceHistory.date.asc()).all()
+        df = pd.DataFrame(rows, columns=["date", "open", "high", "low", "close", "volume"])
+        df["date"] = pd.to_datetime(df["date"])
+        return df.set_index("date")
+    
+    def get_closes(self, symbols: list, start: date = None, end: date = None, refresh: bool = True):
+        """Get close prices for several symbols, one column per symbol, aligned on date"""
+        if not symbols:
+            return pd.DataFrame()
+        
+        if refresh:
+            for symbol in symbols:
+                self.refresh(symbol)
+        
+        query = self.db.query(
+            PriceHistory.date, PriceHistory.symbol, PriceHistory.close
+        ).filter(PriceHistory.symbol.in_(symbols))
+        if start is not None:
+            query = query.filter(PriceHistory.date >= start)
+        if end is not None:
+            query = query.filter(PriceHistory.date <= end)
+        
+        rows = query.all()
+        if not rows:
+            return pd.DataFrame()
+        
+        df = pd.DataFrame(rows, columns=["date", "symbol", "close"])
+        df["date"] = pd.to_datetime(df["date"])
+        closes = df.pivot(index="date", columns="symbol", values="close").sort_index()
+        return closes[[s for s in symbols if s in closes.columns]]
+    
+    def default_start(self):
+        """Start of the default analysis window"""
+        return date.today() - timedelta(days=Config.PRICE_LOOKBACK_DAYS)
\ No newline at end of file
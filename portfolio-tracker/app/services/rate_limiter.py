@@ -0,0 +1,163 @@
+import math
+import threading
+import time
+from urllib.parse import urlsplit
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+
+# Request priorities: interactive calls (UI refreshes) go before background syncs
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every caller of one provider"""
+    
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self, tokens: float = 1):
+        """Block until `tokens` are available, then take them"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = max(self.paused_until - now, (tokens - self.tokens) / self.rate)
+            time.sleep(max(wait, 0.01))
+    
+    def pause(self, seconds: float):
+        """Stop handing out tokens for a while, e.g. after the provider reported a rate limit"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = 0
+            self.updated = now
+            self.paused_until = max(self.paused_until, now + seconds)
+
+def _number(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return None
+
+def trading212_limits(headers):
+    """(limit, remaining, seconds_to_reset) from Trading212's x-ratelimit-* headers, or None"""
+    remaining = _number(headers, "x-ratelimit-remaining")
+    if remaining is None:
+        return None
+    reset = _number(headers, "x-ratelimit-reset")
+    # The reset is a Unix timestamp; treat small values as seconds from now
+    if reset is not None and reset > 1e9:
+        reset -= time.time()
+    return _number(headers, "x-ratelimit-limit"), remaining, reset
+
+def binance_limits(headers):
+    """(limit, remaining, seconds_to_reset) from Binance's used request weight, or None"""
+    used = _number(headers, "X-MBX-USED-WEIGHT-1M", "X-MBX-USED-WEIGHT")
+    if used is None:
+        return None
+    # The weight window is the calendar minute
+    limit = Config.BINANCE_WEIGHT_LIMIT
+    return limit, limit - used, 60 - time.time() % 60
+
+class _Window:
+    __slots__ = ("limit", "remaining", "reset_at", "pending")
+    
+    def __init__(self):
+        self.limit = None
+        self.remaining = None  # None until a response reports it
+        self.reset_at = 0.0
+        self.pending = 0  # Granted requests whose response has not been seen yet
+
+class AdaptiveRateLimiter:
+    """Schedules requests from the limit headers a provider returns, keeping a reserve for interactive calls"""
+    
+    def __init__(self, read_limits, per_path: bool = False, reserve: float = None):
+        # read_limits(headers) -> (limit, remaining, seconds_to_reset) or None. per_path keeps a
+        # window per URL path for providers that limit each endpoint separately (Trading212).
+        self.read_limits = read_limits
+        self.per_path = per_path
+        self.reserve = Config.RATE_LIMIT_INTERACTIVE_RESERVE if reserve is None else reserve
+        self.windows = {}
+        self.waiting_interactive = 0
+        self.condition = threading.Condition()
+    
+    def key_for(self, url: str):
+        return urlsplit(url).path if self.per_path else ""
+    
+    def _floor(self, window: _Window, priority: int):
+        """Units a request of this priority must leave in the window"""
+        if priority == INTERACTIVE or not window.limit:
+            return 0
+        return min(math.ceil(window.limit * self.reserve), window.limit - 1)
+    
+    def acquire(self, key: str, priority: int = INTERACTIVE, cost: float = 1):
+        """Block until the shared budget allows a request of this priority, then reserve `cost`"""
+        with self.condition:
+            if priority == INTERACTIVE:
+                self.waiting_interactive += 1
+            try:
+                while True:
+                    window = self.windows.setdefault(key, _Window())
+                    now = time.monotonic()
+                    if window.remaining is not None and now >= window.reset_at:
+                        # New window: unknown until the next response reports it
+                        window.remaining = None
+                    
+                    # Background calls also yield while an interactive call is queued
+                    blocked = priority == BACKGROUND and self.waiting_interactive > 0
+                    if not blocked and (window.remaining is None or
+                                        window.remaining - cost >= self._floor(window, priority)):
+                        if window.remaining is not None:
+                            window.remaining -= cost
+                        window.pending += cost
+                        return
+                    
+                    timeout = window.reset_at - now if window.remaining is not None else None
+                    self.condition.wait(timeout=max(timeout, 0.01) if timeout is not None else 1.0)
+            finally:
+                if priority == INTERACTIVE:
+                    self.waiting_interactive -= 1
+                    self.condition.notify_all()
+    
+    def observe(self, key: str, response=None, cost: float = 1):
+        """Update the window from a response (None when the request failed) and wake waiters"""
+        with self.condition:
+            window = self.windows.setdefault(key, _Window())
+            window.pending = max(window.pending - cost, 0)
+            
+            if response is not None:
+                now = time.monotonic()
+                limits = self.read_limits(response.headers)
+                if limits:
+                    limit, remaining, reset = limits
+                    if limit:
+                        window.limit = limit
+                    # The reported count does not include requests still in flight
+                    window.remaining = remaining - window.pending
+                    if reset is not None:
+                        window.reset_at = now + max(reset, 0)
+                
+                if response.status_code in (418, 429):
+                    retry_after = _number(response.headers, "Retry-After")
+                    window.remaining = 0
+                    window.reset_at = max(window.reset_at, now + (retry_after if retry_after is not None else 1))
+            
+            self.condition.notify_all()
\ No newline at end of file
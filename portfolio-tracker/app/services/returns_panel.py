@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+# Panels kept in memory, shared by every RiskService/OptimizationService in the process
+MAX_CACHED_PANELS = 16
+_panel_cache = OrderedDict()
+
+class ReturnsPanel:
+    """Aligned price and return matrices for one symbol set and date range"""
+    
+    def __init__(self, closes: pd.DataFrame):
+        closes = closes.sort_index().dropna(axis=1, how="all")
+        
+        self.symbols = list(closes.columns)
+        self.dates = closes.index
+        self.prices = closes.to_numpy(dtype=float)
+        
+        # Same as a per-symbol pct_change: a return spans any gap in that symbol's own history
+        if len(self.dates) > 1:
+            filled = closes.ffill().to_numpy(dtype=float)
+            self.returns = self.prices[1:] / filled[:-1] - 1
+        else:
+            self.returns = np.empty((0, len(self.symbols)))
+        self.return_dates = self.dates[1:]
+        
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.complete_rows = ~np.isnan(self.returns).any(axis=1)
+    
+    @property
+    def empty(self):
+        return len(self.symbols) == 0 or len(self.returns) == 0
+    
+    def __contains__(self, symbol):
+        return symbol in self._index
+    
+    def column(self, symbol: str):
+        """Index of a symbol in the price/return matrices"""
+        return self._index[symbol]
+    
+    def complete_returns(self):
+        """Returns on the dates where every symbol traded"""
+        return self.returns[self.complete_rows]
+    
+    def weights_vector(self, symbols: list, weights: list = None):
+        """Map weights given in `symbols` order onto the panel columns"""
+        w = np.zeros(len(self.symbols))
+        if weights is None:
+            weights = [1 / len(symbols)] * len(symbols)
+        for symbol, weight in zip(symbols, weights):
+            if symbol in self._index:
+                w[self._index[symbol]] = weight
+        return w
+    
+    def prices_frame(self):
+        return pd.DataFrame(self.prices, index=self.dates, columns=self.symbols)
+    
+    def returns_frame(self):
+        return pd.DataFrame(self.returns, index=self.return_dates, columns=self.symbols)
+
+def get_cached_panel(key, build):
+    """Return the panel cached under key, building it on a miss"""
+    if key in _panel_cache:
+        _panel_cache.move_to_end(key)
+        return _panel_cache[key]
+    
+    panel = build()
+    if panel.empty:
+        return panel
+    _panel_cache[key] = panel
+    while len(_panel_cache) > MAX_CACHED_PANELS:
+        _panel_cache.popitem(last=False)
+    return panel
+
+def clear_panel_cache():
+    _panel_cache.clear()
\ No newline at end of file
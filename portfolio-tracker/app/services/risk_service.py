@@ -1,22 +1,34 @@
 import numpy as np
 import pandas as pd
-from alpha_vantage.timeseries import TimeSeries
+from datetime import date
+from sqlalchemy.orm import Session
 import sys
 import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from config import Config
+from app.services.price_store import PriceStore
+from app.services.returns_panel import ReturnsPanel, get_cached_panel
+from app.services.rolling_risk import RollingRiskEngine, DEFAULT_WINDOW
+from app.services.var_engine import (
+    DEFAULT_CONFIDENCES, DEFAULT_HORIZONS, DEFAULT_VAR_SIMULATIONS,
+    historical_var, parametric_var, monte_carlo_var, component_var, var_frame
+)
+from app.services.monte_carlo import (
+    TRADING_DAYS, DEFAULT_CHUNK_SIZE, DEFAULT_PERCENTILES,
+    make_rng, simulate_paths, simulate_quantiles, simulate_portfolio_quantiles
+)
 
 class RiskService:
-    def __init__(self):
-        self.ts = TimeSeries(key=Config.ALPHA_VANTAGE_API_KEY, output_format='pandas')
+    def __init__(self, db: Session = None):
+        self.price_store = PriceStore(db)
     
     def get_historical_prices(self, symbol: str, period: str = "full"):
-        """Get historical daily prices for a symbol"""
+        """Get historical daily prices for a symbol from the local price store"""
         try:
-            data, meta = self.ts.get_daily(symbol=symbol, outputsize='compact')
-            data = data.sort_index()
-            return data['4. close']
+            data = self.price_store.get_history(symbol, start=self.price_store.default_start())
+            if data.empty:
+                return None
+            return data['close']
         except Exception as e:
             return None
     
@@ -54,83 +66,270 @@ class RiskService:
             return 0
         return covariance / market_variance
     
+    def calculate_betas(self, returns, benchmark_returns, min_periods: int = 20):
+        """Beta, alpha, R² and residual volatility of every column against a benchmark in one pass"""
+        if isinstance(returns, pd.DataFrame):
+            symbols = list(returns.columns)
+            R = returns.to_numpy(dtype=float)
+        else:
+            R = np.atleast_2d(np.asarray(returns, dtype=float))
+            symbols = list(range(R.shape[1]))
+        m = np.asarray(benchmark_returns, dtype=float).reshape(-1, 1)
+        
+        valid = ~np.isnan(R) & ~np.isnan(m)
+        R0 = np.where(valid, R, 0.0)
+        m0 = np.where(valid, m, 0.0)
+        
+        n = valid.sum(axis=0)
+        sx = m0.sum(axis=0)
+        sy = R0.sum(axis=0)
+        sxx = (m0 * m0).sum(axis=0)
+        syy = (R0 * R0).sum(axis=0)
+        sxy = (m0 * R0).sum(axis=0)
+        
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var_x = sxx - sx * sx / n
+            var_y = syy - sy * sy / n
+            cov_xy = sxy - sx * sy / n
+            
+            beta = cov_xy / var_x
+            alpha = (sy / n - beta * sx / n) * 252
+            ss_res = np.maximum(var_y - beta * cov_xy, 0)
+            r_squared = np.where(var_y > 0, 1 - ss_res / var_y, np.nan)
+            residual_vol = np.sqrt(ss_res / (n - 2)) * np.sqrt(252)
+        
+        stats = pd.DataFrame({
+            "beta": beta,
+            "alpha": alpha,
+            "r_squared": r_squared,
+            "residual_vol": residual_vol,
+            "observations": n
+        }, index=symbols)
+        
+        insufficient = (n < min_periods) | ~(var_x > 0)
+        stats.loc[insufficient, ["beta", "alpha", "r_squared", "residual_vol"]] = np.nan
+        return stats
+    
+    def get_returns_panel(self, symbols: list, start: date = None, end: date = None):
+        """Get the shared aligned price/returns panel for a symbol set and date range"""
+        if start is None:
+            start = self.price_store.default_start()
+        if end is None:
+            end = date.today()
+        
+        key = (tuple(sorted(set(symbols))), start, end)
+        
+        def build():
+            try:
+                closes = self.price_store.get_closes(list(key[0]), start=start, end=end)
+            except Exception as e:
+                closes = pd.DataFrame()
+            return ReturnsPanel(closes)
+        
+        return get_cached_panel(key, build)
+    
     def get_portfolio_risk_metrics(self, symbols: list, weights: list = None):
         """Calculate risk metrics for entire portfolio"""
-        if weights is None:
-            weights = [1/len(symbols)] * len(symbols)
-        
-        all_returns = {}
+        panel = self.get_returns_panel(symbols)
         metrics = {}
         
-        for symbol in symbols:
-            prices = self.get_historical_prices(symbol)
-            if prices is not None and len(prices) > 0:
-                all_returns[symbol] = self.calculate_returns(prices)
-                
+        if panel.empty:
+            return metrics
+        
+        returns = panel.returns
+        counts = (~np.isnan(returns)).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            volatility = np.nanstd(returns, axis=0, ddof=1) * np.sqrt(252)
+            sharpe = np.where(volatility > 0, (np.nanmean(returns, axis=0) * 252 - 0.05) / volatility, 0)
+            
+            peaks = np.fmax.accumulate(panel.prices, axis=0)
+            max_drawdown = np.nanmin(panel.prices / peaks - 1, axis=0)
+        
+        for symbol in panel.symbols:
+            i = panel.column(symbol)
+            if counts[i] > 0:
                 metrics[symbol] = {
-                    "volatility": self.calculate_volatility(all_returns[symbol]),
-                    "sharpe_ratio": self.calculate_sharpe_ratio(all_returns[symbol]),
-                    "max_drawdown": self.calculate_max_drawdown(prices)
+                    "volatility": volatility[i],
+                    "sharpe_ratio": sharpe[i],
+                    "max_drawdown": max_drawdown[i]
                 }
         
-        if all_returns:
-            returns_df = pd.DataFrame(all_returns).dropna()
+        complete = panel.complete_returns()
+        if len(complete) > 0:
+            w = panel.weights_vector(symbols, weights)
+            portfolio_returns = pd.Series(complete @ w)
             
-            if not returns_df.empty:
-                portfolio_returns = (returns_df * weights[:len(returns_df.columns)]).sum(axis=1)
-                
-                metrics["portfolio"] = {
-                    "volatility": self.calculate_volatility(portfolio_returns),
-                    "sharpe_ratio": self.calculate_sharpe_ratio(portfolio_returns),
-                    "max_drawdown": self.calculate_max_drawdown((1 + portfolio_returns).cumprod())
-                }
+            metrics["portfolio"] = {
+                "volatility": self.calculate_volatility(portfolio_returns),
+                "sharpe_ratio": self.calculate_sharpe_ratio(portfolio_returns),
+                "max_drawdown": self.calculate_max_drawdown((1 + portfolio_returns).cumprod())
+            }
         
         return metrics
     
     def get_cumulative_returns(self, symbols: list):
         """Get cumulative returns for charting"""
-        all_data = {}
+        panel = self.get_returns_panel(symbols)
+        
+        if panel.empty:
+            return None
         
-        for symbol in symbols:
-            prices = self.get_historical_prices(symbol)
-            if prices is not None and len(prices) > 0:
-                returns = self.calculate_returns(prices)
-                cumulative = (1 + returns).cumprod() - 1
-                all_data[symbol] = cumulative * 100  # Convert to percentage
+        returns = panel.returns
+        missing = np.isnan(returns)
+        cumulative = np.cumprod(np.where(missing, 1.0, 1 + returns), axis=0) - 1
+        cumulative[missing] = np.nan
         
-        if all_data:
-            return pd.DataFrame(all_data)
-        return None
+        # Convert to percentage
+        return pd.DataFrame(cumulative * 100, index=panel.return_dates, columns=panel.symbols)
     
     def get_correlation_matrix(self, symbols: list):
         """Get correlation matrix between symbols"""
-        all_returns = {}
+        panel = self.get_returns_panel(symbols)
+        
+        if panel.empty:
+            return None
+        
+        complete = panel.complete_returns()
+        if len(complete) < 2:
+            return None
+        
+        corr = np.corrcoef(complete, rowvar=False)
+        return pd.DataFrame(np.atleast_2d(corr), index=panel.symbols, columns=panel.symbols)
+    
+    def get_rolling_metrics(self, symbols: list, window: int = DEFAULT_WINDOW, benchmark: str = None,
+                            risk_free_rate: float = 0.05):
+        """Rolling volatility, Sharpe, drawdown (and beta against benchmark) for every symbol"""
+        # Returns (metrics, engine); call engine.update() with each new day's closes instead of refitting
+        panel = self.get_returns_panel(symbols + ([benchmark] if benchmark else []))
+        if panel.empty:
+            return None, None
+        
+        prices = panel.prices_frame()
+        bench = None
+        if benchmark:
+            if benchmark not in panel:
+                return None, None
+            bench = prices[benchmark]
+        columns = [s for s in symbols if s in panel]
+        
+        engine = RollingRiskEngine(window=window, risk_free_rate=risk_free_rate)
+        metrics = engine.fit(prices[columns], bench)
+        return metrics, engine
+    
+    def get_var_report(self, symbols: list, weights: list = None,
+                       confidences: tuple = DEFAULT_CONFIDENCES, horizons: tuple = DEFAULT_HORIZONS,
+                       simulations: int = DEFAULT_VAR_SIMULATIONS, seed: int = None):
+        """Historical, parametric and Monte Carlo VaR/CVaR for every holding and the portfolio"""
+        # Values are losses as a fraction of position value; frames are indexed by (horizon, confidence)
+        panel = self.get_returns_panel(symbols)
+        if panel.empty:
+            return None
+        
+        complete = panel.complete_returns()
+        if len(complete) < 2:
+            return None
         
-        for symbol in symbols:
-            prices = self.get_historical_prices(symbol)
-            if prices is not None and len(prices) > 0:
-                all_returns[symbol] = self.calculate_returns(prices)
+        w = panel.weights_vector(symbols, weights)
+        matrix = np.column_stack([complete, complete @ w])
+        columns = panel.symbols + ["portfolio"]
         
-        if all_returns:
-            returns_df = pd.DataFrame(all_returns).dropna()
-            return returns_df.corr()
-        return None
+        report = {"observations": len(complete)}
+        methods = {
+            "historical": historical_var(matrix, confidences, horizons),
+            "parametric": parametric_var(matrix, confidences, horizons),
+            "monte_carlo": monte_carlo_var(complete, w, confidences, horizons, simulations, seed=seed)
+        }
+        for method, results in methods.items():
+            report[method] = {
+                measure: var_frame(values, columns, confidences, horizons)
+                for measure, values in results.items()
+            }
+        return report
+    
+    def get_component_var(self, symbols: list, weights: list = None,
+                          confidence: float = 0.95, horizon: int = 1):
+        """Marginal and component VaR per position, showing which holdings drive portfolio tail risk"""
+        panel = self.get_returns_panel(symbols)
+        if panel.empty:
+            return None
+        
+        complete = panel.complete_returns()
+        if len(complete) < 2:
+            return None
+        
+        w = panel.weights_vector(symbols, weights)
+        result = component_var(complete, w, confidence, horizon)
+        portfolio_var = result["portfolio_var"]
+        
+        return pd.DataFrame({
+            "weight": w,
+            "marginal_var": result["marginal_var"],
+            "component_var": result["component_var"],
+            "contribution": result["component_var"] / portfolio_var if portfolio_var > 0 else 0.0
+        }, index=panel.symbols).sort_values("component_var", ascending=False)
     
     def monte_carlo_simulation(self, current_value: float, annual_return: float = 0.08, 
                                 volatility: float = 0.15, years: int = 10, 
-                                simulations: int = 1000):
+                                simulations: int = 1000, seed: int = None):
         """Run Monte Carlo simulation for portfolio growth"""
-        days = years * 252
-        daily_return = annual_return / 252
-        daily_vol = volatility / np.sqrt(252)
+        days = years * TRADING_DAYS
+        daily_return = annual_return / TRADING_DAYS
+        daily_vol = volatility / np.sqrt(TRADING_DAYS)
+        
+        rng = make_rng(seed)
+        return simulate_paths(current_value, daily_return, daily_vol, days, simulations, rng)
+    
+    def monte_carlo_quantiles(self, current_value: float, annual_return: float = 0.08,
+                              volatility: float = 0.15, years: int = 10,
+                              simulations: int = 1000, percentiles: tuple = DEFAULT_PERCENTILES,
+                              chunk_size: int = DEFAULT_CHUNK_SIZE, seed: int = None,
+                              keep_terminal: bool = True, workers: int = None):
+        """Streaming Monte Carlo: per-day percentile bands and terminal values with bounded memory"""
+        days = years * TRADING_DAYS
+        daily_return = annual_return / TRADING_DAYS
+        daily_vol = volatility / np.sqrt(TRADING_DAYS)
+        
+        # workers > 1 shards the paths over a process pool; for a given seed the result is the same
+        return simulate_quantiles(current_value, daily_return, daily_vol, days, simulations, seed=seed,
+                                  percentiles=percentiles, chunk_size=chunk_size,
+                                  keep_terminal=keep_terminal, workers=workers)
+    
+    def monte_carlo_portfolio(self, holdings: dict, current_prices: dict, years: int = 1,
+                              simulations: int = 10000, step_days: int = 5,
+                              percentiles: tuple = DEFAULT_PERCENTILES, chunk_size: int = None,
+                              seed: int = None, workers: int = None):
+        """Correlated multi-asset Monte Carlo driven by the historical covariance of the holdings"""
+        values = {}
+        for symbol, data in holdings.items():
+            if data["quantity"] > 0 and current_prices.get(symbol, 0) > 0:
+                values[symbol] = data["quantity"] * current_prices[symbol]
+        
+        if not values:
+            return None
+        
+        panel = self.get_returns_panel(list(values.keys()))
+        if panel.empty:
+            return None
+        
+        complete = panel.complete_returns()
+        if len(complete) < 2:
+            return None
         
-        results = np.zeros((simulations, days))
+        log_returns = np.log1p(complete)
+        mean_log = log_returns.mean(axis=0)
+        cov = np.atleast_2d(np.cov(log_returns, rowvar=False))
+        position_values = np.array([values[symbol] for symbol in panel.symbols])
         
-        for i in range(simulations):
-            prices = [current_value]
-            for _ in range(days - 1):
-                shock = np.random.normal(daily_return, daily_vol)
-                prices.append(prices[-1] * (1 + shock))
-            results[i] = prices
+        steps = max(1, int(np.ceil(years * TRADING_DAYS / step_days)))
+        result = simulate_portfolio_quantiles(position_values, mean_log, cov, steps, step_days,
+                                              simulations, seed=seed, percentiles=percentiles,
+                                              chunk_size=chunk_size, workers=workers)
         
-        return results
\ No newline at end of file
+        columns = [f"p{p}" for p in percentiles]
+        result["assets"] = pd.DataFrame(result.pop("asset_terminal_percentiles"),
+                                        index=panel.symbols, columns=columns)
+        result["assets"]["current_value"] = position_values
+        result["assets"]["mean"] = result.pop("asset_terminal_mean")
+        result["current_value"] = position_values.sum()
+        result["excluded"] = [symbol for symbol in values if symbol not in panel]
+        return result
\ No newline at end of file
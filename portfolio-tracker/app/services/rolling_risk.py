@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+from collections import deque
+
+from app.services.monte_carlo import TRADING_DAYS
+
+# Default window: roughly one quarter of trading days
+DEFAULT_WINDOW = 63
+
+def _window_sums(x: np.ndarray, window: int):
+    """Trailing window sums of every column via one cumulative sum"""
+    c = np.vstack([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)])
+    out = np.full(x.shape, np.nan)
+    out[window - 1:] = c[window:] - c[:-window]
+    return out
+
+def _rolling_max(x: np.ndarray, window: int):
+    """Trailing window max ignoring NaN (van Herk/Gil-Werman, O(n) per column)"""
+    rows, cols = x.shape
+    out = np.full(x.shape, np.nan)
+    if rows == 0:
+        return out
+    
+    head = min(window - 1, rows)
+    with np.errstate(invalid="ignore"):
+        out[:head] = np.fmax.accumulate(x[:head], axis=0)
+    if rows < window:
+        return out
+    
+    pad = (-rows) % window
+    padded = np.vstack([x, np.full((pad, cols), np.nan)])
+    blocks = padded.reshape(-1, window, cols)
+    prefix = np.fmax.accumulate(blocks, axis=1).reshape(-1, cols)
+    suffix = np.fmax.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, cols)
+    out[window - 1:] = np.fmax(suffix[:rows - window + 1], prefix[window - 1:rows])
+    return out
+
+class RollingRiskEngine:
+    """Rolling volatility, Sharpe, beta and drawdown for many symbols, refreshable one day at a time"""
+    
+    def __init__(self, window: int = DEFAULT_WINDOW, risk_free_rate: float = 0.05):
+        self.window = window
+        self.risk_free_rate = risk_free_rate
+        self.symbols = []
+    
+    def fit(self, prices: pd.DataFrame, benchmark: pd.Series = None):
+        """Compute the full rolling history and keep the state needed for update()"""
+        prices = prices.sort_index()
+        self.symbols = list(prices.columns)
+        self.has_benchmark = benchmark is not None
+        w = self.window
+        
+        p = prices.to_numpy(dtype=float)
+        r = np.full(p.shape, np.nan)
+        if len(p) > 1:
+            filled = prices.ffill().to_numpy(dtype=float)
+            r[1:] = p[1:] / filled[:-1] - 1
+        
+        if self.has_benchmark:
+            bench = benchmark.reindex(prices.index)
+            b = bench.to_numpy(dtype=float)
+            m = np.full(len(b), np.nan)
+            if len(b) > 1:
+                m[1:] = b[1:] / bench.ffill().to_numpy(dtype=float)[:-1] - 1
+        else:
+            m = np.zeros(len(p))
+        
+        valid = ~np.isnan(r)
+        if self.has_benchmark:
+            valid &= ~np.isnan(m)[:, None]
+        r0 = np.where(valid, r, 0.0)
+        m0 = np.where(valid, m[:, None], 0.0)
+        
+        sums = {
+            "n": _window_sums(valid.astype(float), w),
+            "r": _window_sums(r0, w),
+            "rr": _window_sums(r0 * r0, w),
+            "m": _window_sums(m0, w),
+            "mm": _window_sums(m0 * m0, w),
+            "rm": _window_sums(r0 * m0, w)
+        }
+        metrics = self._metrics(sums)
+        
+        peaks = _rolling_max(p, w)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            metrics["drawdown"] = p / peaks - 1
+        
+        results = {
+            name: pd.DataFrame(values, index=prices.index, columns=self.symbols)
+            for name, values in metrics.items()
+        }
+        
+        self._init_state(p, r0, m0, valid, prices.ffill().to_numpy(dtype=float),
+                         None if not self.has_benchmark else benchmark.reindex(prices.index).ffill().to_numpy(dtype=float))
+        return results
+    
+    def _metrics(self, s: dict):
+        """Volatility, Sharpe and beta from window sums (arrays of any matching shape)"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            n = s["n"]
+            full = n >= self.window
+            mean = s["r"] / n
+            var = (s["rr"] - s["r"] * s["r"] / n) / (n - 1)
+            vol = np.sqrt(np.maximum(var, 0)) * np.sqrt(TRADING_DAYS)
+            sharpe = np.where(vol > 0, (mean * TRADING_DAYS - self.risk_free_rate) / vol, 0.0)
+            
+            metrics = {
+                "volatility": np.where(full, vol, np.nan),
+                "sharpe": np.where(full, sharpe, np.nan)
+            }
+            if self.has_benchmark:
+                var_m = s["mm"] - s["m"] * s["m"] / n
+                cov = s["rm"] - s["r"] * s["m"] / n
+                metrics["beta"] = np.where(full & (var_m > 0), cov / var_m, np.nan)
+        return metrics
+    
+    def _init_state(self, p, r0, m0, valid, filled, bench_filled):
+        """Ring buffers, running sums and per-symbol peak deques for O(symbols) updates"""
+        w = self.window
+        n_symbols = len(self.symbols)
+        
+        self.buf_r = np.zeros((w, n_symbols))
+        self.buf_m = np.zeros((w, n_symbols))
+        self.buf_v = np.zeros((w, n_symbols), dtype=bool)
+        tail = min(w, len(p))
+        if tail:
+            self.buf_r[w - tail:] = r0[-tail:]
+            self.buf_m[w - tail:] = m0[-tail:]
+            self.buf_v[w - tail:] = valid[-tail:]
+        self.pos = 0
+        self.since_resync = 0
+        self._resync()
+        
+        self.last_price = filled[-1].copy() if len(p) else np.full(n_symbols, np.nan)
+        self.last_bench = bench_filled[-1] if bench_filled is not None and len(bench_filled) else np.nan
+        
+        # Monotonic deques of (step, price): the front is the peak of the last `window` prices
+        self.step = len(p) - 1
+        self.peaks = [deque() for _ in range(n_symbols)]
+        for t in range(max(0, len(p) - w), len(p)):
+            for i in range(n_symbols):
+                self._push_peak(i, t, p[t, i])
+    
+    def _resync(self):
+        """Recompute running sums from the ring buffer to stop floating point drift"""
+        v = self.buf_v
+        r0 = np.where(v, self.buf_r, 0.0)
+        m0 = np.where(v, self.buf_m, 0.0)
+        self.sums = {
+            "n": v.sum(axis=0).astype(float),
+            "r": r0.sum(axis=0),
+            "rr": (r0 * r0).sum(axis=0),
+            "m": m0.sum(axis=0),
+            "mm": (m0 * m0).sum(axis=0),
+            "rm": (r0 * m0).sum(axis=0)
+        }
+        self.since_resync = 0
+    
+    def _push_peak(self, i: int, t: int, price: float):
+        peaks = self.peaks[i]
+        if not np.isnan(price):
+            while peaks and peaks[-1][1] <= price:
+                peaks.pop()
+            peaks.append((t, price))
+        while peaks and peaks[0][0] <= t - self.window:
+            peaks.popleft()
+    
+    def update(self, prices, benchmark_price: float = None):
+        """Append one day of prices (Series or array in fit() column order) and return that day's metrics"""
+        if isinstance(prices, pd.Series):
+            prices = prices.reindex(self.symbols)
+        p = np.asarray(prices, dtype=float)
+        
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = p / self.last_price - 1
+            m = benchmark_price / self.last_bench - 1 if self.has_benchmark and benchmark_price is not None else np.nan
+        valid = ~np.isnan(r)
+        if self.has_benchmark:
+            valid &= not np.isnan(m)
+        else:
+            m = 0.0
+        r0 = np.where(valid, r, 0.0)
+        m0 = np.where(valid, m, 0.0)
+        
+        # Swap the oldest slot of the ring buffer for the new day
+        old_v = self.buf_v[self.pos]
+        old_r = np.where(old_v, self.buf_r[self.pos], 0.0)
+        old_m = np.where(old_v, self.buf_m[self.pos], 0.0)
+        s = self.sums
+        s["n"] += valid.astype(float) - old_v
+        s["r"] += r0 - old_r
+        s["rr"] += r0 * r0 - old_r * old_r
+        s["m"] += m0 - old_m
+        s["mm"] += m0 * m0 - old_m * old_m
+        s["rm"] += r0 * m0 - old_r * old_m
+        
+        self.buf_r[self.pos] = r0
+        self.buf_m[self.pos] = m0
+        self.buf_v[self.pos] = valid
+        self.pos = (self.pos + 1) % self.window
+        
+        self.since_resync += 1
+        if self.since_resync >= self.window:
+            self._resync()
+        
+        self.last_price = np.where(np.isnan(p), self.last_price, p)
+        if self.has_benchmark and benchmark_price is not None and not np.isnan(benchmark_price):
+            self.last_bench = benchmark_price
+        
+        self.step += 1
+        drawdown = np.full(len(self.symbols), np.nan)
+        for i in range(len(self.symbols)):
+            self._push_peak(i, self.step, p[i])
+            if self.peaks[i] and not np.isnan(p[i]):
+                drawdown[i] = p[i] / self.peaks[i][0][1] - 1
+        
+        metrics = self._metrics(self.sums)
+        metrics["drawdown"] = drawdown
+        return {name: pd.Series(values, index=self.symbols) for name, values in metrics.items()}
\ No newline at end of file
@@ -1,19 +1,32 @@
 import os
-import requests
+import sys
 import base64
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
-from app.database.models import Transaction, TransactionType
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+from app.database.models import TransactionType, RealizedPnL, BrokerSyncState
+from app.services.import_pipeline import transaction_row, write_transactions, existing_order_ids
+from app.services.http_client import get_client
+from app.services.rate_limiter import AdaptiveRateLimiter, trading212_limits, BACKGROUND
 
 load_dotenv()
 
+# Watermark of the combined order history ingest (transactions and realized P/L)
+SYNC_STATE_KEY = "trading212_history"
+
+# One limiter per process: Trading212 limits each endpoint separately, shared by syncs and the UI
+_limiter = AdaptiveRateLimiter(trading212_limits, per_path=True)
+
 class Trading212Service:
     def __init__(self, db: Session):
         self.db = db
         self.api_key = os.getenv('TRADING212_API_KEY')
         self.api_key_id = os.getenv('TRADING212_API_KEY_ID')
         self.base_url = "https://live.trading212.com/api/v0"
+        self.http = get_client("trading212", limiter=_limiter)
         
         # Create Basic Auth header
         if self.api_key_id and self.api_key:
@@ -26,7 +39,7 @@ class Trading212Service:
     def test_connection(self):
         """Test API connection"""
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/equity/account/cash",
                 headers=self.headers
             )
@@ -40,7 +53,7 @@ class Trading212Service:
     def get_portfolio(self):
         """Get current portfolio positions"""
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/equity/portfolio",
                 headers=self.headers
             )
@@ -57,7 +70,7 @@ class Trading212Service:
             if cursor:
                 params["cursor"] = cursor
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.base_url}/equity/history/orders",
                 headers=self.headers,
                 params=params
@@ -68,178 +81,187 @@ class Trading212Service:
         except:
             return {"items": [], "nextPagePath": None}
     
-    def sync_all_transactions(self, portfolio_id: int):
-        """Sync all transactions from Trading212 to database"""
-        imported = 0
-        skipped = 0
+    def get_sync_state(self, portfolio_id: int):
+        """High-watermark of the last complete order history sync, or None"""
+        return self.db.query(BrokerSyncState).filter(
+            BrokerSyncState.portfolio_id == portfolio_id,
+            BrokerSyncState.broker == SYNC_STATE_KEY
+        ).first()
+    
+    def save_sync_state(self, portfolio_id: int, order_id: str, order_at: datetime):
+        state = self.get_sync_state(portfolio_id)
+        if state is None:
+            state = BrokerSyncState(portfolio_id=portfolio_id, broker=SYNC_STATE_KEY)
+            self.db.add(state)
+        state.last_order_id = order_id
+        state.last_order_at = order_at
+        self.db.commit()
+    
+    @staticmethod
+    def _order_time(order: dict):
+        date_str = order.get("createdAt")
+        if not date_str:
+            return None
+        try:
+            return datetime.fromisoformat(date_str.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            return None
+    
+    def sync_history(self, portfolio_id: int, on_progress=None, full_resync: bool = False):
+        """Fetch the order history once and ingest both transactions and realized P/L"""
+        # History pages are newest first by creation time, so paging stops at the first order created
+        # more than T212_SYNC_LOOKBACK_DAYS before the stored watermark. The overlap picks up orders
+        # created earlier that only completed after the last sync. full_resync walks every page;
+        # rows and P/L records already stored are skipped either way.
+        tx_skipped = 0
+        pnl_skipped = 0
         errors = []
+        rows = []
+        # By order id; the ones already stored are dropped by one lookup after paging
+        pnl_records = {}
         
-        next_url = f"{self.base_url}/equity/history/orders?limit=50"
+        state = None if full_resync else self.get_sync_state(portfolio_id)
+        stop_before = None
+        if state and state.last_order_at:
+            stop_before = state.last_order_at - timedelta(days=Config.T212_SYNC_LOOKBACK_DAYS)
+        newest = None
+        complete = False
         
-        while next_url:
-            try:
-                response = requests.get(next_url, headers=self.headers)
-                if response.status_code != 200:
-                    break
-                
-                result = response.json()
-                items = result.get("items", [])
-                
-                if not items:
-                    break
-                
-                for item in items:
-                    try:
-                        order = item.get("order", {})
-                        fill = item.get("fill", {})
-                        
-                        if order.get("status") != "FILLED":
-                            continue
-                        
-                        ticker = order.get("ticker", "")
-                        if not ticker:
-                            continue
-                        
-                        # Clean ticker (remove _US_EQ suffix)
-                        symbol = ticker.replace("_US_EQ", "").replace("_EQ", "")
-                        
-                        # Get side from order
-                        side = order.get("side", "").upper()
-                        if side == "BUY":
-                            tx_type = TransactionType.BUY
-                        elif side == "SELL":
-                            tx_type = TransactionType.SELL
-                        else:
-                            continue
-                        
-                        quantity = float(order.get("filledQuantity", 0))
-                        price = float(fill.get("price", 0) or order.get("limitPrice", 0) or 0)
-                        
-                        # Parse date from fill
-                        date_str = fill.get("filledAt") or order.get("createdAt")
-                        if date_str:
-                            tx_date = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-                            tx_date = tx_date.replace(tzinfo=None)
-                        else:
-                            tx_date = datetime.utcnow()
-                        
-                        # Check for duplicate
-                        existing = self.db.query(Transaction).filter(
-                            Transaction.portfolio_id == portfolio_id,
-                            Transaction.symbol == symbol,
-                            Transaction.quantity == quantity,
-                            Transaction.price == price,
-                            Transaction.date == tx_date
-                        ).first()
-                        
-                        if existing:
-                            skipped += 1
-                            continue
-                        
-                        transaction = Transaction(
-                            portfolio_id=portfolio_id,
-                            symbol=symbol,
-                            transaction_type=tx_type,
-                            quantity=quantity,
-                            price=price,
-                            fee=0,
-                            date=tx_date
-                        )
-                        
-                        self.db.add(transaction)
-                        imported += 1
-                        
-                    except Exception as e:
-                        errors.append(f"Order error: {str(e)}")
-                
-                # Check for next page
-                next_path = result.get("nextPagePath")
-                if next_path:
-                    next_url = f"https://live.trading212.com{next_path}"
-                else:
-                    next_url = None
-                    
-            except Exception as e:
-                errors.append(f"Page error: {str(e)}")
-                break
-        
-        self.db.commit()
-        
-        return {
-            "success": True,
-            "imported": imported,
-            "skipped": skipped,
-            "errors": errors[:20]
-        }
-    def sync_realized_pnl(self, portfolio_id: int) -> dict:
-        """Sync realized P/L from Trading212 order history"""
-        from app.database.models import RealizedPnL
-        from datetime import datetime
+        next_url = f"{self.base_url}/equity/history/orders?limit=50"
         
         try:
-            imported = 0
-            skipped = 0
-            
-            url = "https://live.trading212.com/api/v0/equity/history/orders"
-            
-            while url:
-                response = requests.get(url, headers=self.headers)
-                if response.status_code != 200:
-                    break
-                
-                data = response.json()
-                
-                for item in data.get('items', []):
-                    order = item.get('order', {})
-                    fill = item.get('fill', {})
-                    wallet = fill.get('walletImpact', {})
-                    
-                    order_id = str(order.get('id', ''))
-                    realized = wallet.get('realisedProfitLoss', 0)
+            while next_url:
+                try:
+                    response = self.http.get(next_url, headers=self.headers, priority=BACKGROUND)
+                    if response.status_code != 200:
+                        break
                     
-                    if not order_id:
-                        continue
+                    result = response.json()
+                    items = result.get("items", [])
                     
-                    existing = self.db.query(RealizedPnL).filter(
-                        RealizedPnL.order_id == order_id
-                    ).first()
+                    if not items:
+                        complete = True
+                        break
                     
-                    if existing:
-                        skipped += 1
-                        continue
-                    
-                    order_date = None
-                    date_str = order.get('createdAt', '')
-                    if date_str:
+                    reached_watermark = False
+                    for item in items:
                         try:
-                            order_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                        except:
-                            pass
+                            order = item.get("order", {})
+                            fill = item.get("fill", {})
+                            
+                            order_id = str(order.get("id", ""))
+                            order_at = self._order_time(order)
+                            if newest is None:
+                                newest = (order_id, order_at)
+                            
+                            # Orders inside the lookback fall to the dedup by order id and fingerprint
+                            if stop_before and order_at and order_at < stop_before:
+                                reached_watermark = True
+                                break
+                            
+                            ticker = order.get("ticker", "")
+                            # Clean ticker (remove _US_EQ suffix)
+                            symbol = ticker.replace("_US_EQ", "").replace("_EQ", "")
+                            
+                            # Realized P/L is recorded for every order, once
+                            if order_id:
+                                if order_id in pnl_records:
+                                    pnl_skipped += 1
+                                else:
+                                    pnl_records[order_id] = RealizedPnL(
+                                        portfolio_id=portfolio_id,
+                                        symbol=symbol,
+                                        order_id=order_id,
+                                        realized_pnl=fill.get("walletImpact", {}).get("realisedProfitLoss", 0),
+                                        order_date=order_at
+                                    )
+                            
+                            if order.get("status") != "FILLED" or not ticker:
+                                continue
+                            
+                            # Get side from order
+                            side = order.get("side", "").upper()
+                            if side == "BUY":
+                                tx_type = TransactionType.BUY
+                            elif side == "SELL":
+                                tx_type = TransactionType.SELL
+                            else:
+                                continue
+                            
+                            quantity = float(order.get("filledQuantity", 0))
+                            price = float(fill.get("price", 0) or order.get("limitPrice", 0) or 0)
+                            
+                            # Parse date from fill
+                            date_str = fill.get("filledAt") or order.get("createdAt")
+                            if date_str:
+                                tx_date = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+                                tx_date = tx_date.replace(tzinfo=None)
+                            else:
+                                tx_date = datetime.utcnow()
+                            
+                            rows.append(transaction_row(portfolio_id, symbol, tx_type, quantity, price, 0, tx_date,
+                                                        external_id=f"trading212:{order_id}" if order_id else None))
+                        
+                        except Exception as e:
+                            errors.append(f"Order error: {str(e)}")
                     
-                    ticker = order.get('ticker', '').replace('_US_EQ', '').replace('_EQ', '')
+                    if reached_watermark:
+                        complete = True
+                        break
                     
-                    pnl_record = RealizedPnL(
-                        portfolio_id=portfolio_id,
-                        symbol=ticker,
-                        order_id=order_id,
-                        realized_pnl=realized,
-                        order_date=order_date
-                    )
-                    self.db.add(pnl_record)
-                    imported += 1
+                    # Check for next page
+                    next_path = result.get("nextPagePath")
+                    if next_path:
+                        next_url = f"https://live.trading212.com{next_path}"
+                    else:
+                        next_url = None
+                        complete = True
                 
-                next_path = data.get('nextPagePath')
-                if next_path:
-                    url = f"https://live.trading212.com{next_path}"
-                else:
-                    url = None
+                except Exception as e:
+                    errors.append(f"Page error: {str(e)}")
+                    break
+            
+            stored = existing_order_ids(self.db, list(pnl_records.values()))
+            pnl_skipped += len(stored & pnl_records.keys())
+            pnl_records = [record for order_id, record in pnl_records.items() if order_id not in stored]
             
+            # Both tables are written in one DB transaction: the chunks are only flushed and committed
+            # together with the P/L records. Rows already stored are dropped by the prefetch in
+            # write_transactions; the unique index only guards against races.
+            self.db.add_all(pnl_records)
+            tx_imported = write_transactions(self.db, portfolio_id, rows, on_progress=on_progress, commit=False)
+            tx_skipped += len(rows) - tx_imported
             self.db.commit()
-            return {"success": True, "imported": imported, "skipped": skipped}
         
         except Exception as e:
             self.db.rollback()
             return {"success": False, "error": str(e)}
+        
+        # Only a sync that reached the watermark or the end may move it, otherwise a gap would be skipped
+        if complete and newest and newest[0]:
+            self.save_sync_state(portfolio_id, *newest)
+        
+        return {
+            "success": True,
+            "imported": tx_imported,
+            "skipped": tx_skipped,
+            "pnl_imported": len(pnl_records),
+            "pnl_skipped": pnl_skipped,
+            "errors": errors[:20]
+        }
+    
+    def sync_all_transactions(self, portfolio_id: int, on_progress=None, full_resync: bool = False):
+        """Sync new transactions from Trading212 to database"""
+        # Realized P/L is ingested by the same pass
+        return self.sync_history(portfolio_id, on_progress=on_progress, full_resync=full_resync)
+    
+    def sync_realized_pnl(self, portfolio_id: int, full_resync: bool = False) -> dict:
+        """Sync realized P/L from Trading212 order history"""
+        result = self.sync_history(portfolio_id, full_resync=full_resync)
+        if not result["success"]:
+            return result
+        return {"success": True, "imported": result["pnl_imported"], "skipped": result["pnl_skipped"]}
+    
     def get_realized_pnl_by_symbol(self, portfolio_id: int) -> dict:
         """Get total realized P/L grouped by symbol"""
         from app.database.models import RealizedPnL
@@ -256,7 +278,7 @@ class Trading212Service:
     def get_instruments(self) -> dict:
         """Get instrument metadata with company names"""
         try:
-            response = requests.get(
+            response = self.http.get(
                 "https://live.trading212.com/api/v0/equity/metadata/instruments",
                 headers=self.headers
             )
@@ -0,0 +1,140 @@
+import time
+import pandas as pd
+import requests
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from config import Config
+from app.services.rate_limiter import TokenBucket
+from app.services.http_client import get_client, RETRY_STATUSES
+
+# One bucket per process, so every session shares the account's per-minute quota
+_bucket = TokenBucket(Config.TWELVE_DATA_RATE_LIMIT)
+
+# Attempts per symbol after the first; the HTTP client does not retry on its own, so every attempt takes a token
+MAX_RETRIES = 3
+
+# Day on which the account ran out of daily credits; requests fail fast until it changes
+_exhausted_on = None
+DAILY_LIMIT_ERROR = "Twelve Data daily API credits are used up; try again tomorrow"
+
+# Daily bars requested per symbol
+DEFAULT_OUTPUTSIZE = 100
+
+class TwelveDataService:
+    def __init__(self, api_key: str = None, max_workers: int = None):
+        self.api_key = api_key or Config.TWELVE_DATA_API_KEY
+        self.max_workers = max_workers or Config.TWELVE_DATA_MAX_WORKERS
+        self.base_url = "https://api.twelvedata.com"
+        self.bucket = _bucket
+        self.http = get_client("twelve_data", pool_size=Config.TWELVE_DATA_MAX_WORKERS, max_retries=0)
+    
+    def _is_rate_limited(self, data: dict):
+        """Twelve Data reports quota errors in the body, usually with code 429"""
+        message = str(data.get("message", "")).lower()
+        return data.get("code") == 429 or "api credits" in message or "rate limit" in message
+    
+    def _is_daily_limit(self, data: dict):
+        """The daily quota message mentions the day, the per-minute one the current minute"""
+        return "for the day" in str(data.get("message", "")).lower()
+    
+    def _seconds_to_next_minute(self):
+        return 61 - time.time() % 60
+    
+    def get_daily_closes(self, symbol: str, outputsize: int = DEFAULT_OUTPUTSIZE):
+        """Get daily closes for a symbol, oldest first. Returns (Series, error)."""
+        global _exhausted_on
+        if not self.api_key:
+            return None, "Twelve Data API key is not configured (set TWELVE_DATA_KEY)"
+        if _exhausted_on == date.today():
+            return None, DAILY_LIMIT_ERROR
+        
+        params = {
+            "symbol": symbol,
+            "interval": "1day",
+            "outputsize": outputsize,
+            "apikey": self.api_key
+        }
+        
+        for attempt in range(MAX_RETRIES + 1):
+            self.bucket.acquire()
+            if _exhausted_on == date.today():
+                # Another worker hit the daily quota while this one waited for a token
+                return None, DAILY_LIMIT_ERROR
+            try:
+                r = self.http.get(f"{self.base_url}/time_series", params=params, timeout=15)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt < MAX_RETRIES:
+                    time.sleep(self.http.backoff(attempt))
+                    continue
+                return None, str(e)
+            except Exception as e:
+                return None, str(e)
+            
+            if r.status_code in RETRY_STATUSES and r.status_code != 429 and attempt < MAX_RETRIES:
+                time.sleep(self.http.backoff(attempt))
+                continue
+            try:
+                data = r.json()
+            except ValueError:
+                data = {"code": r.status_code, "message": f"HTTP {r.status_code}"}
+            
+            if "values" in data:
+                values = data["values"]
+                closes = pd.Series(
+                    [float(v["close"]) for v in values],
+                    index=pd.to_datetime([v["datetime"] for v in values]),
+                    name=symbol
+                )
+                return closes.sort_index(), None
+            
+            if self._is_rate_limited(data) and self._is_daily_limit(data):
+                # Waiting for the next minute will not help; fail every remaining symbol at once
+                _exhausted_on = date.today()
+                return None, data.get("message", "Daily API credits used up")
+            
+            if self._is_rate_limited(data) and attempt < MAX_RETRIES:
+                # Quota is per minute: hold every worker until it resets
+                self.bucket.pause(self._seconds_to_next_minute())
+                continue
+            
+            return None, data.get("message", "No data returned")
+        
+        return None, "Rate limit retries exhausted"
+    
+    def get_daily_returns(self, symbol: str, outputsize: int = DEFAULT_OUTPUTSIZE):
+        """Get daily simple returns for a symbol. Returns (Series, error)."""
+        closes, error = self.get_daily_closes(symbol, outputsize)
+        if closes is None:
+            return None, error
+        return closes.pct_change().dropna(), None
+    
+    def get_many_daily_returns(self, symbols: list, outputsize: int = DEFAULT_OUTPUTSIZE, on_progress=None):
+        """Fetch daily returns for many symbols concurrently within the rate limit. Returns (returns, errors)."""
+        # on_progress(done, total, symbol) runs on the calling thread, so it may update Streamlit widgets
+        returns = {}
+        errors = {}
+        if not symbols:
+            return returns, errors
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.get_daily_returns, symbol, outputsize): symbol
+                for symbol in symbols
+            }
+            
+            for done, future in enumerate(as_completed(futures), start=1):
+                symbol = futures[future]
+                series, error = future.result()
+                if series is not None and len(series) > 0:
+                    returns[symbol] = series
+                else:
+                    errors[symbol] = error or "No data returned"
+                
+                if on_progress:
+                    on_progress(done, len(symbols), symbol)
+        
+        return returns, errors
\ No newline at end of file
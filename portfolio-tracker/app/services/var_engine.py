@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+from app.services.monte_carlo import factor_covariance, make_rng
+
+DEFAULT_CONFIDENCES = (0.95, 0.99)
+DEFAULT_HORIZONS = (1, 10)
+DEFAULT_VAR_SIMULATIONS = 10000
+
+_normal = NormalDist()
+
+def horizon_returns(returns: np.ndarray, horizon: int):
+    """Overlapping compounded h-day returns for every column"""
+    if horizon == 1:
+        return returns
+    logs = np.vstack([np.zeros((1, returns.shape[1])), np.cumsum(np.log1p(returns), axis=0)])
+    return np.expm1(logs[horizon:] - logs[:-horizon])
+
+def _tail_measures(returns: np.ndarray, confidences):
+    """Historical VaR and CVaR (positive losses) per column from one sort; shape (len(confidences), columns)"""
+    losses = np.sort(-returns, axis=0)
+    n = len(losses)
+    var = np.quantile(losses, confidences, axis=0)
+    
+    # CVaR: mean of the worst ceil((1 - c) * n) losses, read off a reversed cumulative sum
+    tail_sums = np.cumsum(losses[::-1], axis=0)
+    cvar = np.empty_like(var)
+    for i, c in enumerate(confidences):
+        k = max(1, int(np.ceil((1 - c) * n)))
+        cvar[i] = tail_sums[k - 1] / k
+    return var, cvar
+
+def historical_var(returns: np.ndarray, confidences=DEFAULT_CONFIDENCES, horizons=DEFAULT_HORIZONS):
+    """Historical VaR/CVaR per column; dict of arrays shaped (horizons, confidences, columns)"""
+    var = np.full((len(horizons), len(confidences), returns.shape[1]), np.nan)
+    cvar = var.copy()
+    for i, h in enumerate(horizons):
+        if len(returns) >= h + 1:
+            var[i], cvar[i] = _tail_measures(horizon_returns(returns, h), confidences)
+    return {"var": var, "cvar": cvar}
+
+def parametric_var(returns: np.ndarray, confidences=DEFAULT_CONFIDENCES, horizons=DEFAULT_HORIZONS):
+    """Normal (variance-covariance) VaR/CVaR per column with square-root-of-time scaling"""
+    mu = returns.mean(axis=0)
+    sigma = returns.std(axis=0, ddof=1)
+    z = np.array([_normal.inv_cdf(c) for c in confidences])
+    tail = np.array([_normal.pdf(_normal.inv_cdf(c)) / (1 - c) for c in confidences])
+    h = np.asarray(horizons, dtype=float)[:, None, None]
+    
+    mu_h = mu * h
+    sigma_h = sigma * np.sqrt(h)
+    return {
+        "var": z[None, :, None] * sigma_h - mu_h,
+        "cvar": tail[None, :, None] * sigma_h - mu_h
+    }
+
+def monte_carlo_var(returns: np.ndarray, weights: np.ndarray, confidences=DEFAULT_CONFIDENCES,
+                    horizons=DEFAULT_HORIZONS, simulations: int = DEFAULT_VAR_SIMULATIONS, seed=None):
+    """Monte Carlo VaR/CVaR from correlated lognormal h-day returns; last column is the portfolio"""
+    log_returns = np.log1p(returns)
+    mean_log = log_returns.mean(axis=0)
+    cov = np.atleast_2d(np.cov(log_returns, rowvar=False))
+    factor = factor_covariance(cov)
+    
+    rng = make_rng(seed)
+    shocks = rng.standard_normal((simulations, factor.shape[1])) @ factor.T
+    
+    var = np.empty((len(horizons), len(confidences), returns.shape[1] + 1))
+    cvar = np.empty_like(var)
+    for i, h in enumerate(horizons):
+        simulated = np.expm1(shocks * np.sqrt(h) + mean_log * h)
+        # Buy and hold over the horizon: the portfolio return is the weighted asset return
+        simulated = np.column_stack([simulated, simulated @ weights])
+        var[i], cvar[i] = _tail_measures(simulated, confidences)
+    return {"var": var, "cvar": cvar}
+
+def component_var(returns: np.ndarray, weights: np.ndarray, confidence: float = 0.95, horizon: int = 1):
+    """Delta-normal marginal and component VaR per position; components sum to the portfolio VaR"""
+    cov = np.atleast_2d(np.cov(returns, rowvar=False)) * horizon
+    z = _normal.inv_cdf(confidence)
+    
+    exposure = cov @ weights
+    portfolio_sigma = np.sqrt(weights @ exposure)
+    if portfolio_sigma <= 0:
+        marginal = np.zeros(len(weights))
+    else:
+        marginal = z * exposure / portfolio_sigma
+    component = weights * marginal
+    return {
+        "portfolio_var": z * portfolio_sigma,
+        "marginal_var": marginal,
+        "component_var": component
+    }
+
+def var_frame(results: np.ndarray, columns: list, confidences, horizons):
+    """Flatten (horizons, confidences, columns) arrays into a frame indexed by (horizon, confidence)"""
+    index = pd.MultiIndex.from_product([list(horizons), list(confidences)], names=["horizon", "confidence"])
+    return pd.DataFrame(results.reshape(-1, results.shape[-1]), index=index, columns=columns)
\ No newline at end of file
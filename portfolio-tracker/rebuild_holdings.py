@@ -0,0 +1,11 @@
+from app.database.connection import get_db, init_db
+from app.database.models import Portfolio
+from app.services.portfolio_service import PortfolioService
+
+init_db()
+db = next(get_db())
+service = PortfolioService(db)
+
+for portfolio in db.query(Portfolio).all():
+    count = service.rebuild_holdings(portfolio.id, commit=True)
+    print(f'{portfolio.name} (id {portfolio.id}): {count} holdings rebuilt')
\ No newline at end of file